@@ -1,296 +1,71 @@
-import re
+import threading
+import uuid
 import streamlit as st
-from study_buddy import explainer_agent, quiz_agent
-import os
-import time
+from study_buddy import CHUNK_TOKENS, in_flight, is_long_document, plan_calls, response_cache
+from jobs import JobQueue
+from artifacts import ArtifactStore, text_key
+from prefetch import Prefetcher
+from examples import EXAMPLES, seed_artifacts
+from offline import OFFLINE_NOTE
+from quiz_model import EXPLANATION_LEVELS, QUIZ_DIFFICULTIES
+from scheduler import scheduler
+from static_assets import build_static_assets
+from storage import HistoryStore
+from text_processing import clean_text, split_into_chunks
+from llm_client import (
+    LLMAuthError, LLMCircuitOpenError, LLMError, LLMRateLimitError, LLMTimeoutError, warm_up
+)
 from datetime import datetime, timedelta
-from PIL import Image, ImageDraw
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
 import random
-import base64
 
 # ============================================================================
 # CUSTOM CSS & STYLING
 # ============================================================================
-st.markdown("""
-<style>
-    /* Main theme variables */
-    :root {
-        --primary: #667eea;
-        --secondary: #764ba2;
-        --accent: #10b981;
-        --warning: #f59e0b;
-        --danger: #ef4444;
-        --dark: #1e293b;
-        --light: #f8fafc;
-        --gradient: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        --gradient-light: linear-gradient(135deg, #f0f9ff 0%, #e0f2fe 100%);
-        --gradient-success: linear-gradient(135deg, #10b981 0%, #059669 100%);
-        --gradient-warning: linear-gradient(135deg, #f59e0b 0%, #d97706 100%);
-    }
-    
-    /* Global styles */
-    body {
-        background: linear-gradient(135deg, #f0f9ff 0%, #e0f2fe 50%, #fef3c7 100%);
-        background-attachment: fixed;
-        font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
-    }
-    
-    /* Main header with animated gradient */
-    .main-header {
-        background: var(--gradient);
-        padding: 2.5rem;
-        border-radius: 20px;
-        color: white;
-        margin-bottom: 2rem;
-        box-shadow: 0 15px 30px rgba(102, 126, 234, 0.3);
-        position: relative;
-        overflow: hidden;
-        animation: gradientShift 10s ease infinite;
-        background-size: 400% 400%;
-    }
-    
-    @keyframes gradientShift {
-        0%, 100% { background-position: 0% 50%; }
-        50% { background-position: 100% 50%; }
-    }
-    
-    /* Card styles */
-    .glass-card {
-        background: rgba(255, 255, 255, 0.9);
-        backdrop-filter: blur(10px);
-        border-radius: 20px;
-        padding: 1.5rem;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.1);
-        border: 1px solid rgba(255, 255, 255, 0.2);
-        transition: all 0.3s ease;
-    }
-    
-    .glass-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 15px 40px rgba(0, 0, 0, 0.15);
-    }
-    
-    .metric-card {
-        background: var(--gradient-light);
-        padding: 1.5rem;
-        border-radius: 16px;
-        border-left: 5px solid var(--primary);
-        box-shadow: 0 4px 16px rgba(0, 0, 0, 0.08);
-        margin-bottom: 1rem;
-    }
-    
-    .agent-card {
-        background: var(--gradient);
-        color: white;
-        padding: 1.5rem;
-        border-radius: 16px;
-        margin: 1rem 0;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .agent-card::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        background: linear-gradient(45deg, transparent 30%, rgba(255,255,255,0.1) 50%, transparent 70%);
-        animation: shimmer 3s infinite;
-    }
-    
-    @keyframes shimmer {
-        0% { transform: translateX(-100%); }
-        100% { transform: translateX(100%); }
-    }
-    
-    /* Button styles */
-    .stButton > button {
-        border-radius: 12px !important;
-        font-weight: 600 !important;
-        padding: 0.8rem 1.5rem !important;
-        transition: all 0.3s ease !important;
-        border: none !important;
-        box-shadow: 0 4px 12px rgba(0, 0, 0, 0.1) !important;
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-3px) !important;
-        box-shadow: 0 8px 20px rgba(0, 0, 0, 0.2) !important;
-    }
-    
-    /* Primary button */
-    .primary-btn {
-        background: var(--gradient) !important;
-        color: white !important;
-    }
-    
-    /* Secondary button */
-    .secondary-btn {
-        background: var(--gradient-light) !important;
-        color: var(--dark) !important;
-        border: 2px solid var(--primary) !important;
-    }
-    
-    /* Tab styling */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 1rem;
-        background: transparent;
-        padding: 0.5rem;
-        border-radius: 16px;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        height: 50px;
-        border-radius: 12px;
-        padding: 0 24px;
-        font-weight: 600;
-        background: var(--gradient-light);
-        border: 2px solid transparent;
-        transition: all 0.3s ease;
-    }
-    
-    .stTabs [data-baseweb="tab"]:hover {
-        border-color: var(--primary);
-        transform: translateY(-2px);
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background: var(--gradient) !important;
-        color: white !important;
-        box-shadow: 0 5px 15px rgba(102, 126, 234, 0.4) !important;
-    }
-    
-    /* Text area styling */
-    .stTextArea textarea {
-        border-radius: 16px !important;
-        border: 2px solid #e2e8f0 !important;
-        transition: all 0.3s ease !important;
-        font-size: 14px !important;
-        padding: 1rem !important;
-    }
-    
-    .stTextArea textarea:focus {
-        border-color: var(--primary) !important;
-        box-shadow: 0 0 0 3px rgba(102, 126, 234, 0.2) !important;
-    }
-    
-    /* Progress bar */
-    .stProgress > div > div > div > div {
-        background: var(--gradient) !important;
-    }
-    
-    /* Sidebar styling */
-    section[data-testid="stSidebar"] {
-        background: linear-gradient(180deg, #ffffff 0%, #f8fafc 100%) !important;
-        border-right: 1px solid #e2e8f0 !important;
-    }
-    
-    /* Custom badges */
-    .badge {
-        display: inline-flex;
-        align-items: center;
-        padding: 0.25rem 0.75rem;
-        border-radius: 20px;
-        font-size: 0.75rem;
-        font-weight: 600;
-        margin: 0.25rem;
-    }
-    
-    .badge-primary {
-        background: var(--gradient);
-        color: white;
-    }
-    
-    .badge-success {
-        background: var(--gradient-success);
-        color: white;
-    }
-    
-    .badge-warning {
-        background: var(--gradient-warning);
-        color: white;
-    }
-    
-    /* Floating elements */
-    .floating {
-        animation: float 6s ease-in-out infinite;
-    }
-    
-    @keyframes float {
-        0%, 100% { transform: translateY(0); }
-        50% { transform: translateY(-10px); }
-    }
-    
-    /* Pulse animation */
-    .pulse {
-        animation: pulse 2s infinite;
-    }
-    
-    @keyframes pulse {
-        0%, 100% { opacity: 1; }
-        50% { opacity: 0.7; }
-    }
-    
-    /* Custom scrollbar */
-    ::-webkit-scrollbar {
-        width: 8px;
-        height: 8px;
-    }
-    
-    ::-webkit-scrollbar-track {
-        background: #f1f5f9;
-        border-radius: 4px;
-    }
-    
-    ::-webkit-scrollbar-thumb {
-        background: var(--primary);
-        border-radius: 4px;
-    }
-    
-    ::-webkit-scrollbar-thumb:hover {
-        background: var(--secondary);
-    }
-</style>
-""", unsafe_allow_html=True)
+
+@st.cache_resource
+def get_static_assets():
+    """Publish the content-hashed avatar and read the theme once per server process."""
+    return build_static_assets()
+
+static_assets = get_static_assets()
+
+# Inline, because the static route cannot serve CSS with a type browsers will apply
+st.markdown(f"<style>{static_assets['theme_css']}</style>", unsafe_allow_html=True)
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
-def format_quiz_as_points(quiz_text: str) -> str:
-    """Convert raw quiz text into markdown nested bullet points for clearer display."""
-    if not quiz_text:
-        return ""
-    out_lines = []
-    for line in quiz_text.splitlines():
-        s = line.strip()
-        if not s:
-            continue
-        if re.match(r'^(?:\d+[\.)]|Question[:\s]|Q[:\s])', s, re.I):
-            cleaned = re.sub(r'^(?:\d+[\.)]\s*|Question[:\s]*|Q[:\s]*)', '', s, flags=re.I)
-            out_lines.append(f"### {cleaned}")
-        elif re.match(r'^[A-D][\.|\)]', s, re.I):
-            out_lines.append(f"• **{s[:2]}** {s[2:].strip()}")
-        else:
-            out_lines.append(f"- {s}")
-    return "\n".join(out_lines)
-
-def create_progress_chart(sessions_data):
-    """Create a progress chart for the analytics dashboard."""
-    dates = [s.get('date') for s in sessions_data if s.get('date')]
-    if dates:
-        date_counts = {}
-        for date in dates:
-            date_str = str(date)
-            date_counts[date_str] = date_counts.get(date_str, 0) + 1
-        
+HISTORY_PAGE_SIZE = 10
+JOB_POLL_SECONDS = 1.0
+
+def describe_llm_error(exc: LLMError) -> str:
+    """Turn an LLM client error into a message the student can act on."""
+    if isinstance(exc, LLMAuthError):
+        return "🔑 The Groq API key was rejected. Check GROQ_API_KEY in your .env file."
+    if isinstance(exc, LLMRateLimitError):
+        return "⏳ The AI service is busy right now (rate limit reached). Please try again in a minute."
+    if isinstance(exc, LLMTimeoutError):
+        return "⌛ The AI service took too long to answer. Please try again."
+    if isinstance(exc, LLMCircuitOpenError):
+        return "🔌 The AI service is failing repeatedly, so requests are paused for a moment. Please try again shortly."
+    return f"⚠️ Could not generate study materials: {exc}"
+
+@st.cache_resource
+def warm_llm_client():
+    """Open pooled LLM connections once per server process, in the background."""
+    thread = threading.Thread(target=warm_up, name="llm-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def create_progress_chart(date_counts):
+    """Create a progress chart for the analytics dashboard from per-day session counts."""
+    if date_counts:
         df = pd.DataFrame({
-            'Date': list(date_counts.keys()),
+            'Date': [str(day) for day in date_counts.keys()],
             'Sessions': list(date_counts.values())
         })
         
@@ -316,14 +91,9 @@ def create_progress_chart(sessions_data):
         )
         return fig
 
-def create_difficulty_chart(sessions_data):
-    """Create a difficulty distribution chart."""
-    difficulties = [s.get('difficulty', 'Unknown') for s in sessions_data]
-    if difficulties:
-        diff_counts = {}
-        for diff in difficulties:
-            diff_counts[diff] = diff_counts.get(diff, 0) + 1
-        
+def create_difficulty_chart(diff_counts):
+    """Create a difficulty distribution chart from per-difficulty session counts."""
+    if diff_counts:
         colors = ['#667eea', '#764ba2', '#10b981', '#f59e0b', '#ef4444']
         
         fig = go.Figure(data=[go.Pie(
@@ -343,33 +113,66 @@ def create_difficulty_chart(sessions_data):
         )
         return fig
 
-def get_streak_days(sessions_data):
-    """Calculate consecutive days with sessions."""
-    if not sessions_data:
-        return 0
-    
-    dates = sorted(set([s.get('date') for s in sessions_data if s.get('date')]))
-    if not dates:
-        return 0
-    
-    streak = 1
-    current_date = dates[-1]
-    
-    for i in range(len(dates)-2, -1, -1):
-        if (current_date - dates[i]).days == 1:
-            streak += 1
-            current_date = dates[i]
-        else:
-            break
-    
-    return streak
-
 # ============================================================================
 # INITIALIZE SESSION STATE
 # ============================================================================
 
-if 'history' not in st.session_state:
-    st.session_state.history = []
+@st.cache_resource
+def get_history_store():
+    """One SQLite-backed history store per server process."""
+    return HistoryStore.from_env()
+
+def get_user_id():
+    """Stable per-browser id, kept in the URL so history survives a refresh."""
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = st.query_params.get('uid') or uuid.uuid4().hex
+    st.query_params['uid'] = st.session_state.user_id
+    return st.session_state.user_id
+
+def get_client_id():
+    """Per-session id for jobs, prefetches and fair scheduling.
+
+    Never put in the URL: everyone opening a shared link gets the same `uid`, and
+    must not also share one job list and one fair share of the service.
+    """
+    if 'client_id' not in st.session_state:
+        st.session_state.client_id = uuid.uuid4().hex
+    return st.session_state.client_id
+
+@st.cache_resource
+def get_artifact_store():
+    """Explanations and quizzes already generated, per text and level, shared across users."""
+    artifacts = ArtifactStore.from_env()
+    # Quick Start examples come prebuilt, so trying one costs no quota
+    seed_artifacts(artifacts)
+    return artifacts
+
+@st.cache_resource
+def get_job_queue():
+    """One generation worker pool per server process, shared by every browser tab."""
+    return JobQueue(get_history_store(), get_artifact_store())
+
+@st.cache_resource
+def get_prefetcher():
+    """Background quiz variants at other difficulties, shared across users."""
+    return Prefetcher(get_artifact_store())
+
+history_store = get_history_store()
+job_queue = get_job_queue()
+prefetcher = get_prefetcher()
+user_id = get_user_id()
+client_id = get_client_id()
+# Aggregates are maintained by the store on every add/delete; reading them is O(1)
+history_stats = history_store.stats(user_id)
+total_sessions = history_stats.sessions
+today_sessions = history_store.sessions_on(user_id, datetime.now().date())
+
+if 'active_jobs' not in st.session_state:
+    st.session_state.active_jobs = []
+if 'job_notices' not in st.session_state:
+    st.session_state.job_notices = []
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
 if 'quiz_attempts' not in st.session_state:
     st.session_state.quiz_attempts = []
 if 'achievements' not in st.session_state:
@@ -382,7 +185,7 @@ if 'study_time' not in st.session_state:
     st.session_state.study_time = 0
 
 # Initialize display variables
-for key in ['last_quiz', 'last_explanation', 'last_session_data', 'current_text']:
+for key in ['last_quiz', 'last_explanation', 'last_explanation_for', 'last_session_data', 'current_text']:
     if key not in st.session_state:
         st.session_state[key] = ''
 
@@ -417,22 +220,7 @@ st.set_page_config(
     }
 )
 
-# Create assets directory if it doesn't exist
-ASSETS_DIR = "assets"
-ROBO_PATH = os.path.join(ASSETS_DIR, "robo.jpg")
-if not os.path.exists(ASSETS_DIR):
-    os.makedirs(ASSETS_DIR, exist_ok=True)
-
-if not os.path.exists(ROBO_PATH):
-    img = Image.new("RGB", (160, 160), color=(245, 245, 245))
-    d = ImageDraw.Draw(img)
-    d.rounded_rectangle([20, 20, 140, 120], radius=16, fill=(200, 200, 200), outline=(120, 120, 120))
-    d.ellipse([42, 42, 68, 68], fill=(30, 30, 30))
-    d.ellipse([92, 42, 118, 68], fill=(30, 30, 30))
-    d.rectangle([60, 82, 100, 96], fill=(30, 30, 30))
-    d.line((80, 20, 80, 6), fill=(120, 120, 120), width=4)
-    d.ellipse([76, 0, 84, 8], fill=(220, 0, 0))
-    img.save(ROBO_PATH, format="JPEG")
+warm_llm_client()
 
 # ============================================================================
 # HEADER
@@ -442,7 +230,7 @@ col1, col2, col3 = st.columns([1, 3, 1])
 with col1:
     st.markdown(f"""
     <div class="floating">
-        <img src="data:image/jpeg;base64,{base64.b64encode(open(ROBO_PATH, 'rb').read()).decode()}" 
+        <img src="{static_assets['robot']}" 
              width="120" style="border-radius: 20px; box-shadow: 0 10px 25px rgba(0,0,0,0.2);">
     </div>
     """, unsafe_allow_html=True)
@@ -481,6 +269,69 @@ with col3:
 # SIDEBAR
 # ============================================================================
 
+@st.fragment
+def render_sidebar_history():
+    """Recent sessions and quick stats; their buttons rerun only this region."""
+    # Session History
+    st.markdown("### 📖 Recent Sessions")
+    
+    stats = history_store.stats(user_id)
+    
+    if stats.sessions:
+        recent_sessions = history_store.page(user_id, limit=5)
+        for i, session in enumerate(recent_sessions):
+            timestamp = session.get('timestamp', 'Recent')
+            char_count = session['char_count']
+            
+            with st.container():
+                st.markdown(f"""
+                <div class="glass-card" style="margin-bottom: 0.5rem; cursor: pointer;" 
+                     onclick="this.style.transform='translateY(-2px)'">
+                    <div style="display: flex; justify-content: space-between; align-items: start;">
+                        <div>
+                            <strong style="color: #1e293b;">Session {stats.sessions-i}</strong><br>
+                            <small style="color: #64748b;">{timestamp} • {char_count} chars</small>
+                        </div>
+                        <span style="font-size: 0.8rem; background: linear-gradient(135deg, #f1f5f9 0%, #e2e8f0 100%); 
+                                  padding: 0.2rem 0.5rem; border-radius: 10px;">
+                            {session.get('level', 'N/A')}
+                        </span>
+                    </div>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                btn_col1, btn_col2 = st.columns(2)
+                with btn_col1:
+                    if st.button(f"📝 Load", key=f"load_{session['id']}", width='stretch'):
+                        st.session_state.current_text = history_store.get(user_id, session['id'])['text']
+                        st.toast(f"📚 Loaded Session {stats.sessions-i}")
+                        # The text area lives outside this fragment
+                        st.rerun()
+                with btn_col2:
+                    if st.button(f"📊 Stats", key=f"stats_{session['id']}", width='stretch'):
+                        st.session_state.current_session = session
+    else:
+        st.info("🚀 No sessions yet. Start your learning journey!")
+    
+    st.divider()
+    
+    # Quick Stats
+    if stats.sessions:
+        st.markdown("### 📈 Quick Stats")
+        
+        col_s1, col_s2 = st.columns(2)
+        with col_s1:
+            st.metric("📚 Sessions", stats.sessions)
+        with col_s2:
+            st.metric("📝 Characters", f"{stats.chars:,}")
+    
+    cache_stats = response_cache.stats()
+    st.caption(
+        f"⚡ Response cache: {cache_stats['hits']} hits • {cache_stats['misses']} misses • "
+        f"{cache_stats['entries']} stored • {in_flight.coalesced} shared in flight • "
+        f"{job_queue.artifacts.hits} stages reused"
+    )
+
 with st.sidebar:
     # User Profile
     st.markdown("### 👤 Study Profile")
@@ -488,7 +339,7 @@ with st.sidebar:
     with st.container():
         col_a, col_b = st.columns(2)
         with col_a:
-            st.metric("🔥 Streak", f"{get_streak_days(st.session_state.history)} days")
+            st.metric("🔥 Streak", f"{history_stats.streak} days")
         with col_b:
             st.metric("⏱️ Study Time", f"{st.session_state.study_time} min")
     
@@ -500,14 +351,14 @@ with st.sidebar:
     with st.expander("📊 **Configuration**", expanded=True):
         explanation_level = st.select_slider(
             "Explanation Depth",
-            options=["Beginner", "Intermediate", "Advanced", "Expert"],
+            options=EXPLANATION_LEVELS,
             value="Intermediate",
             help="Adjust how detailed the explanations should be"
         )
         
         quiz_difficulty = st.select_slider(
             "Quiz Challenge Level",
-            options=["Easy", "Medium", "Hard", "Expert", "Master"],
+            options=QUIZ_DIFFICULTIES,
             value="Medium",
             help="Set the difficulty of quiz questions"
         )
@@ -525,60 +376,45 @@ with st.sidebar:
             ["Active Recall", "Concept Mapping", "Spaced Repetition", "Feynman Technique", "Mixed"],
             help="Choose your preferred learning strategy"
         )
+        
+        fused_agent = st.toggle(
+            "🧩 Single-Call Mode",
+            value=False,
+            help="One AI call writes the explanation, key points and quiz together: faster, and half the requests"
+        )
+        
+        parallel_agents = st.toggle(
+            "⚡ Parallel Agents",
+            value=True,
+            disabled=fused_agent,
+            help="Write the quiz from your text while the explanation is generated, instead of one after the other"
+        )
+        
+        refine_quiz = st.checkbox(
+            "🔁 Refine Quiz",
+            value=False,
+            disabled=fused_agent or not parallel_agents,
+            help="After both agents finish, check the quiz against the explanation (one extra call)"
+        )
+        
+        instant_preview = st.checkbox(
+            "⚡ Instant Preview",
+            value=True,
+            help="Show a quick summary picked from your text while the AI writes the full explanation"
+        )
+        
+        prefetch_quizzes = st.checkbox(
+            "🔮 Prefetch Other Levels",
+            value=False,
+            help="Once an explanation is ready, write its quiz at the other challenge levels in the background "
+                 "using spare quota, so switching levels is instant"
+        )
+        if prefetch_quizzes and prefetcher.active(client_id):
+            st.caption("🔮 Preparing quizzes at other challenge levels...")
     
     st.divider()
     
-    # Session History
-    st.markdown("### 📖 Recent Sessions")
-    
-    if st.session_state.history:
-        recent_sessions = list(reversed(st.session_state.history[-5:]))
-        for i, session in enumerate(recent_sessions):
-            timestamp = session.get('timestamp', 'Recent')
-            char_count = len(session['text'])
-            
-            with st.container():
-                st.markdown(f"""
-                <div class="glass-card" style="margin-bottom: 0.5rem; cursor: pointer;" 
-                     onclick="this.style.transform='translateY(-2px)'">
-                    <div style="display: flex; justify-content: space-between; align-items: start;">
-                        <div>
-                            <strong style="color: #1e293b;">Session {len(st.session_state.history)-i}</strong><br>
-                            <small style="color: #64748b;">{timestamp} • {char_count} chars</small>
-                        </div>
-                        <span style="font-size: 0.8rem; background: linear-gradient(135deg, #f1f5f9 0%, #e2e8f0 100%); 
-                                  padding: 0.2rem 0.5rem; border-radius: 10px;">
-                            {session.get('level', 'N/A')}
-                        </span>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                btn_col1, btn_col2 = st.columns(2)
-                with btn_col1:
-                    if st.button(f"📝 Load", key=f"load_{i}", width='stretch'):
-                        st.session_state.current_text = session['text']
-                        st.success(f"📚 Loaded Session {len(st.session_state.history)-i}")
-                with btn_col2:
-                    if st.button(f"📊 Stats", key=f"stats_{i}", width='stretch'):
-                        st.session_state.current_session = session
-    else:
-        st.info("🚀 No sessions yet. Start your learning journey!")
-    
-    st.divider()
-    
-    # Quick Stats
-    if st.session_state.history:
-        st.markdown("### 📈 Quick Stats")
-        
-        total_sessions = len(st.session_state.history)
-        total_chars = sum(len(s['text']) for s in st.session_state.history)
-        
-        col_s1, col_s2 = st.columns(2)
-        with col_s1:
-            st.metric("📚 Sessions", total_sessions)
-        with col_s2:
-            st.metric("📝 Characters", f"{total_chars:,}")
+    render_sidebar_history()
 
 # ============================================================================
 # MAIN CONTENT TABS
@@ -621,6 +457,30 @@ This process occurs in the chloroplasts and involves two main stages: light-depe
                 with col_c3:
                     readability = "Good" if 100 <= word_count <= 500 else "Needs adjustment"
                     st.metric("📊 Readability", readability)
+                
+                # What the agents will actually be sent, after cleanup
+                cleaned = clean_text(user_text)
+                if is_long_document(cleaned.text):
+                    sections = len(split_into_chunks(cleaned.text, CHUNK_TOKENS))
+                    st.caption(f"📚 Long document: it will be explained in {sections} sections in parallel, then merged.")
+                
+                planned_calls = plan_calls(
+                    user_text,
+                    level=explanation_level,
+                    difficulty=quiz_difficulty,
+                    num_questions=num_questions,
+                    fused=fused_agent,
+                    parallel=parallel_agents,
+                    refine=refine_quiz
+                )
+                planned_total = sum(prompt + output for _, prompt, output in planned_calls)
+                trimmed = f" ({cleaned.saved_tokens:,} trimmed by cleanup)" if cleaned.saved_tokens > 0 else ""
+                with st.expander(
+                    f"🧮 Token plan: ~{cleaned.tokens:,} input tokens{trimmed} • "
+                    f"{len(planned_calls)} AI calls • up to ~{planned_total:,} tokens"
+                ):
+                    for label, prompt_tokens, max_tokens in planned_calls:
+                        st.markdown(f"- **{label}**: ~{prompt_tokens:,} tokens in → at most {max_tokens:,} out")
             
             st.markdown('</div>', unsafe_allow_html=True)
         
@@ -683,30 +543,86 @@ This process occurs in the chloroplasts and involves two main stages: light-depe
                 """, unsafe_allow_html=True)
         
         with st.expander("🚀 **Quick Start**"):
-            examples = [
-                ("🌱 Biology", "Photosynthesis process in plants"),
-                ("⚛️ Physics", "Newton's Laws of Motion"),
-                ("💻 Computer Science", "Machine Learning basics"),
-                ("📊 Economics", "Supply and demand principles"),
-                ("📚 Literature", "Literary analysis techniques")
-            ]
-            
-            for emoji, topic in examples:
-                if st.button(f"{emoji} {topic}", width='stretch', key=f"ex_{topic}"):
-                    example_texts = {
-                        "Biology": "Photosynthesis is the process by which plants convert sunlight into chemical energy...",
-                        "Physics": "Newton's First Law states that an object at rest stays at rest...",
-                        "Computer Science": "Machine Learning is a subset of AI that enables computers to learn patterns...",
-                        "Economics": "Supply and demand is an economic model of price determination...",
-                        "Literature": "Literary analysis involves examining the elements of a literary text..."
-                    }
-                    st.session_state.current_text = example_texts.get(topic.split()[0], "")
+            for example in EXAMPLES:
+                if st.button(f"{example.emoji} {example.topic}", width='stretch', key=f"ex_{example.topic}"):
+                    st.session_state.current_text = example.text
                     st.rerun()
 
 # ============================================================================
 # TAB 2: RESULTS
 # ============================================================================
 
+@st.fragment
+def render_explanation_tab():
+    """Explanation and its feedback form; submitting feedback reruns only this tab."""
+    with st.container():
+        st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+        st.markdown("#### 🎯 Simplified Explanation")
+        st.markdown(st.session_state.last_explanation)
+        st.markdown('</div>', unsafe_allow_html=True)
+        
+        # Feedback
+        st.markdown("#### 💬 Explanation Feedback")
+        feedback_options = ["👍 Perfect!", "👎 Too Complex", "📝 Need More Detail", "🎯 Off Topic"]
+        st.radio("How was this explanation?", feedback_options, horizontal=True)
+        
+        if st.button("Submit Feedback", type="secondary"):
+            st.toast("Thank you for your feedback! 🎯")
+
+@st.fragment
+def render_quiz_tab(quiz_difficulty):
+    """Quiz view; switching quiz mode reruns only this tab."""
+    with st.container():
+        st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+        st.markdown(f"#### 🧠 Quiz ({quiz_difficulty} Level)")
+        
+        if st.session_state.last_quiz:
+            formatted = st.session_state.last_quiz.to_markdown()
+            st.markdown(formatted)
+            
+            # Interactive Quiz Options
+            st.divider()
+            quiz_mode = st.radio(
+                "Quiz Mode:",
+                ["📋 Standard View", "🎮 Practice Mode", "⏱️ Timed Challenge"],
+                horizontal=True
+            )
+            
+            if quiz_mode == "🎮 Practice Mode":
+                st.info("Practice mode coming soon! Stay tuned.")
+            elif quiz_mode == "⏱️ Timed Challenge":
+                st.info("Timed challenge feature in development.")
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+
+@st.fragment
+def render_key_points_tab():
+    """Key points extracted from the explanation."""
+    with st.container():
+        st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+        st.markdown("#### 🎯 Key Learning Points")
+        
+        # Extract key points from explanation
+        lines = [line.strip() for line in st.session_state.last_explanation.split('\n') if line.strip()]
+        key_points = lines[:min(10, len(lines))]
+        
+        for i, point in enumerate(key_points, 1):
+            st.markdown(f"""
+            <div style="background: var(--gradient-light); padding: 1rem; border-radius: 12px; 
+                        margin-bottom: 0.5rem; border-left: 4px solid var(--primary);">
+                <div style="display: flex; align-items: center;">
+                    <div style="background: var(--primary); color: white; width: 24px; height: 24px; 
+                              border-radius: 50%; display: flex; align-items: center; justify-content: center; 
+                              margin-right: 0.75rem; font-weight: 600;">
+                        {i}
+                    </div>
+                    <div>{point}</div>
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+
 with tab2:
     if st.session_state.get('show_results_notice'):
         st.success("✅ Session details loaded successfully!")
@@ -720,7 +636,8 @@ with tab2:
             col_tools1, col_tools2, col_tools3, col_tools4 = st.columns(4)
             
             with col_tools1:
-                formatted_quiz = format_quiz_as_points(st.session_state.get('last_quiz', ''))
+                last_quiz = st.session_state.get('last_quiz')
+                formatted_quiz = last_quiz.to_markdown() if last_quiz else ''
                 export_content = f"""AI STUDY BUDDY PRO - STUDY SESSION
 {'='*60}
 
@@ -758,6 +675,7 @@ QUIZ QUESTIONS ({quiz_difficulty} Level):
                 if st.button("🔄 New Session", width='stretch'):
                     st.session_state.current_text = ''
                     st.session_state.last_explanation = None
+                    st.session_state.last_explanation_for = None
                     st.session_state.last_quiz = None
                     st.success("Ready for new session!")
             
@@ -779,69 +697,13 @@ QUIZ QUESTIONS ({quiz_difficulty} Level):
         result_tabs = st.tabs(["📖 Explanation", "❓ Interactive Quiz", "🎯 Key Points"])
         
         with result_tabs[0]:
-            with st.container():
-                st.markdown('<div class="glass-card">', unsafe_allow_html=True)
-                st.markdown("#### 🎯 Simplified Explanation")
-                st.markdown(st.session_state.last_explanation)
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Feedback
-                st.markdown("#### 💬 Explanation Feedback")
-                feedback_options = ["👍 Perfect!", "👎 Too Complex", "📝 Need More Detail", "🎯 Off Topic"]
-                selected_feedback = st.radio("How was this explanation?", feedback_options, horizontal=True)
-                
-                if st.button("Submit Feedback", type="secondary"):
-                    st.toast("Thank you for your feedback! 🎯")
+            render_explanation_tab()
         
         with result_tabs[1]:
-            with st.container():
-                st.markdown('<div class="glass-card">', unsafe_allow_html=True)
-                st.markdown(f"#### 🧠 Quiz ({quiz_difficulty} Level)")
-                
-                if st.session_state.last_quiz:
-                    formatted = format_quiz_as_points(st.session_state.last_quiz)
-                    st.markdown(formatted)
-                    
-                    # Interactive Quiz Options
-                    st.divider()
-                    quiz_mode = st.radio(
-                        "Quiz Mode:",
-                        ["📋 Standard View", "🎮 Practice Mode", "⏱️ Timed Challenge"],
-                        horizontal=True
-                    )
-                    
-                    if quiz_mode == "🎮 Practice Mode":
-                        st.info("Practice mode coming soon! Stay tuned.")
-                    elif quiz_mode == "⏱️ Timed Challenge":
-                        st.info("Timed challenge feature in development.")
-                
-                st.markdown('</div>', unsafe_allow_html=True)
+            render_quiz_tab(quiz_difficulty)
         
         with result_tabs[2]:
-            with st.container():
-                st.markdown('<div class="glass-card">', unsafe_allow_html=True)
-                st.markdown("#### 🎯 Key Learning Points")
-                
-                # Extract key points from explanation
-                lines = [line.strip() for line in st.session_state.last_explanation.split('\n') if line.strip()]
-                key_points = lines[:min(10, len(lines))]
-                
-                for i, point in enumerate(key_points, 1):
-                    st.markdown(f"""
-                    <div style="background: var(--gradient-light); padding: 1rem; border-radius: 12px; 
-                                margin-bottom: 0.5rem; border-left: 4px solid var(--primary);">
-                        <div style="display: flex; align-items: center;">
-                            <div style="background: var(--primary); color: white; width: 24px; height: 24px; 
-                                      border-radius: 50%; display: flex; align-items: center; justify-content: center; 
-                                      margin-right: 0.75rem; font-weight: 600;">
-                                {i}
-                            </div>
-                            <div>{point}</div>
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                
-                st.markdown('</div>', unsafe_allow_html=True)
+            render_key_points_tab()
     
     else:
         col_empty1, col_empty2, col_empty3 = st.columns([1, 2, 1])
@@ -867,33 +729,102 @@ QUIZ QUESTIONS ({quiz_difficulty} Level):
 # TAB 3: ANALYTICS
 # ============================================================================
 
+@st.fragment
+def render_history_list():
+    """Paged session history; paging, deleting and expanding rerun only this list."""
+    # Session Details
+    st.markdown("### 📝 Session History")
+    
+    total_sessions = history_store.stats(user_id).sessions
+    page_count = max(1, -(-total_sessions // HISTORY_PAGE_SIZE))
+    st.session_state.history_page = min(st.session_state.history_page, page_count - 1)
+    page_offset = st.session_state.history_page * HISTORY_PAGE_SIZE
+    
+    for i, session in enumerate(history_store.page(user_id, limit=HISTORY_PAGE_SIZE, offset=page_offset)):
+        with st.expander(
+            f"Session {total_sessions-page_offset-i} • "
+            f"{session.get('timestamp', 'N/A')} • "
+            f"{session.get('level', 'N/A')} • "
+            f"⭐ Difficulty: {session.get('difficulty', 'N/A')}",
+            expanded=page_offset + i < 2  # Expand the two newest by default
+        ):
+            col_sess1, col_sess2 = st.columns(2)
+            
+            with col_sess1:
+                st.markdown("**Original Text Preview:**")
+                preview = session['preview'] + "..." if session['char_count'] > len(session['preview']) else session['preview']
+                with st.container():
+                    st.markdown(f'<div style="background: #f8fafc; padding: 1rem; border-radius: 12px; font-size: 0.9rem;">{preview}</div>', 
+                              unsafe_allow_html=True)
+            
+            with col_sess2:
+                if session.get('explanation'):
+                    st.markdown("**Key Insights:**")
+                    lines = [line.strip() for line in session['explanation'].split('\n') if line.strip()][:4]
+                    for line in lines:
+                        st.markdown(f"• {line}")
+                
+                # Session Actions
+                col_act1, col_act2, col_act3 = st.columns(3)
+                with col_act1:
+                    if st.button(f"📖 Review", key=f"review_{session['id']}", width='stretch'):
+                        full_session = history_store.get(user_id, session['id'])
+                        st.session_state.current_text = full_session['text']
+                        st.session_state.last_explanation = full_session.get('explanation')
+                        st.session_state.last_explanation_for = (text_key(full_session['text']), full_session.get('level'))
+                        st.session_state.last_quiz = full_session.get('quiz')
+                        safe_switch_to_results()
+                        # Results live outside this fragment
+                        st.rerun()
+                
+                with col_act2:
+                    if st.button(f"📥 Export", key=f"export_{session['id']}", width='stretch'):
+                        st.success("Session exported to downloads!")
+                
+                with col_act3:
+                    if st.button(f"🗑️", key=f"delete_{session['id']}", width='stretch', type="secondary"):
+                        history_store.delete(user_id, session['id'])
+                        st.rerun(scope="fragment")
+    
+    if page_count > 1:
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.button("⬅️ Newer", width='stretch', disabled=st.session_state.history_page == 0):
+                st.session_state.history_page -= 1
+                st.rerun(scope="fragment")
+        with col_page:
+            st.markdown(f"<div style='text-align: center; padding-top: 0.6rem;'>Page {st.session_state.history_page + 1} of {page_count}</div>",
+                        unsafe_allow_html=True)
+        with col_next:
+            if st.button("Older ➡️", width='stretch', disabled=st.session_state.history_page >= page_count - 1):
+                st.session_state.history_page += 1
+                st.rerun(scope="fragment")
+
 with tab3:
     st.markdown("### 📊 Learning Analytics Dashboard")
     
-    if st.session_state.history:
+    if total_sessions:
         # Summary Metrics
         col_m1, col_m2, col_m3, col_m4 = st.columns(4)
         
         with col_m1:
             with st.container():
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-                st.metric("📚 Total Sessions", len(st.session_state.history), 
-                         delta=f"+{len([s for s in st.session_state.history if s.get('date') == datetime.now().date()])} today")
+                st.metric("📚 Total Sessions", total_sessions, 
+                         delta=f"+{today_sessions} today")
                 st.markdown('</div>', unsafe_allow_html=True)
         
         with col_m2:
             with st.container():
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-                total_chars = sum(len(s['text']) for s in st.session_state.history)
+                total_chars = history_stats.chars
                 st.metric("📝 Text Processed", f"{total_chars:,}", 
-                         delta=f"~{total_chars//max(1, len(st.session_state.history)):,} avg")
+                         delta=f"~{total_chars//max(1, total_sessions):,} avg")
                 st.markdown('</div>', unsafe_allow_html=True)
         
         with col_m3:
             with st.container():
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-                today = datetime.now().date()
-                today_sessions = len([s for s in st.session_state.history if s.get('date') == today])
                 st.metric("🔥 Today's Sessions", today_sessions, 
                          delta="Goal: 3" if today_sessions < 3 else "Goal Achieved! 🎉")
                 st.markdown('</div>', unsafe_allow_html=True)
@@ -901,7 +832,7 @@ with tab3:
         with col_m4:
             with st.container():
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-                streak = get_streak_days(st.session_state.history)
+                streak = history_stats.streak
                 st.metric("⚡ Study Streak", f"{streak} days", 
                          delta="Keep it up!" if streak > 0 else "Start your streak!")
                 st.markdown('</div>', unsafe_allow_html=True)
@@ -910,62 +841,20 @@ with tab3:
         col_chart1, col_chart2 = st.columns(2)
         
         with col_chart1:
-            fig1 = create_progress_chart(st.session_state.history)
+            fig1 = create_progress_chart(history_store.daily_counts(user_id))
             st.plotly_chart(fig1, width='stretch')
         
         with col_chart2:
-            fig2 = create_difficulty_chart(st.session_state.history)
+            fig2 = create_difficulty_chart(history_store.difficulty_counts(user_id))
             st.plotly_chart(fig2, width='stretch')
         
-        # Session Details
-        st.markdown("### 📝 Session History")
-        
-        for i, session in enumerate(reversed(st.session_state.history)):
-            with st.expander(
-                f"Session {len(st.session_state.history)-i} • "
-                f"{session.get('timestamp', 'N/A')} • "
-                f"{session.get('level', 'N/A')} • "
-                f"⭐ Difficulty: {session.get('difficulty', 'N/A')}",
-                expanded=i < 2  # Expand first two by default
-            ):
-                col_sess1, col_sess2 = st.columns(2)
-                
-                with col_sess1:
-                    st.markdown("**Original Text Preview:**")
-                    preview = session['text'][:400] + "..." if len(session['text']) > 400 else session['text']
-                    with st.container():
-                        st.markdown(f'<div style="background: #f8fafc; padding: 1rem; border-radius: 12px; font-size: 0.9rem;">{preview}</div>', 
-                                  unsafe_allow_html=True)
-                
-                with col_sess2:
-                    if session.get('explanation'):
-                        st.markdown("**Key Insights:**")
-                        lines = [line.strip() for line in session['explanation'].split('\n') if line.strip()][:4]
-                        for line in lines:
-                            st.markdown(f"• {line}")
-                    
-                    # Session Actions
-                    col_act1, col_act2, col_act3 = st.columns(3)
-                    with col_act1:
-                        if st.button(f"📖 Review", key=f"review_{i}", width='stretch'):
-                            st.session_state.current_text = session['text']
-                            st.session_state.last_explanation = session.get('explanation')
-                            st.session_state.last_quiz = session.get('quiz')
-                            safe_switch_to_results()
-                    
-                    with col_act2:
-                        if st.button(f"📥 Export", key=f"export_{i}", width='stretch'):
-                            st.success("Session exported to downloads!")
-                    
-                    with col_act3:
-                        if st.button(f"🗑️", key=f"delete_{i}", width='stretch', type="secondary"):
-                            del st.session_state.history[len(st.session_state.history)-1-i]
-                            st.rerun()
+        render_history_list()
         
         # Clear History
         st.divider()
         if st.button("🗑️ Clear All History", type="secondary", width='stretch', icon="⚠️"):
-            st.session_state.history = []
+            history_store.clear(user_id)
+            st.session_state.history_page = 0
             st.session_state.quiz_attempts = []
             st.success("History cleared successfully!")
     
@@ -985,48 +874,53 @@ with tab3:
 # TAB 4: ACHIEVEMENTS
 # ============================================================================
 
+@st.fragment
+def render_achievements():
+    """Achievements grid, rendered independently of the rest of the page."""
+    achievements = [
+        {"icon": "🚀", "name": "First Session", "desc": "Complete your first study session", "xp": 50},
+        {"icon": "🔥", "name": "3-Day Streak", "desc": "Study for 3 consecutive days", "xp": 100},
+        {"icon": "📚", "name": "Bookworm", "desc": "Process 10,000+ characters", "xp": 75},
+        {"icon": "🎯", "name": "Quiz Master", "desc": "Complete 5 quizzes", "xp": 125},
+        {"icon": "⚡", "name": "Speed Learner", "desc": "Complete 3 sessions in one day", "xp": 150},
+        {"icon": "🌟", "name": "Expert Level", "desc": "Use Expert difficulty 5 times", "xp": 200},
+    ]
+    
+    for ach in achievements:
+        unlocked = random.choice([True, False])  # Replace with actual logic
+        with st.container():
+            st.markdown(f"""
+            <div style="background: {'var(--gradient-success)' if unlocked else 'var(--gradient-light)'}; 
+                        padding: 1rem; border-radius: 16px; margin-bottom: 1rem; 
+                        border-left: 4px solid {'var(--accent)' if unlocked else '#cbd5e1'};">
+                <div style="display: flex; align-items: center; justify-content: space-between;">
+                    <div style="display: flex; align-items: center; gap: 1rem;">
+                        <div style="font-size: 1.5rem;">{ach['icon']}</div>
+                        <div>
+                            <div style="font-weight: 600; color: {'white' if unlocked else '#1e293b'};">
+                                {ach['name']}
+                            </div>
+                            <div style="font-size: 0.9rem; color: {'rgba(255,255,255,0.8)' if unlocked else '#64748b'};">
+                                {ach['desc']}
+                            </div>
+                        </div>
+                    </div>
+                    <div style="background: {'rgba(255,255,255,0.2)' if unlocked else 'white'}; 
+                                padding: 0.5rem 1rem; border-radius: 20px; font-weight: 600; 
+                                color: {'white' if unlocked else 'var(--primary)'};">
+                        {ach['xp']} XP
+                    </div>
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+
 with tab4:
     st.markdown("### 🏆 Achievements & Progress")
     
     col_ach1, col_ach2 = st.columns([2, 1])
     
     with col_ach1:
-        achievements = [
-            {"icon": "🚀", "name": "First Session", "desc": "Complete your first study session", "xp": 50},
-            {"icon": "🔥", "name": "3-Day Streak", "desc": "Study for 3 consecutive days", "xp": 100},
-            {"icon": "📚", "name": "Bookworm", "desc": "Process 10,000+ characters", "xp": 75},
-            {"icon": "🎯", "name": "Quiz Master", "desc": "Complete 5 quizzes", "xp": 125},
-            {"icon": "⚡", "name": "Speed Learner", "desc": "Complete 3 sessions in one day", "xp": 150},
-            {"icon": "🌟", "name": "Expert Level", "desc": "Use Expert difficulty 5 times", "xp": 200},
-        ]
-        
-        for ach in achievements:
-            unlocked = random.choice([True, False])  # Replace with actual logic
-            with st.container():
-                st.markdown(f"""
-                <div style="background: {'var(--gradient-success)' if unlocked else 'var(--gradient-light)'}; 
-                            padding: 1rem; border-radius: 16px; margin-bottom: 1rem; 
-                            border-left: 4px solid {'var(--accent)' if unlocked else '#cbd5e1'};">
-                    <div style="display: flex; align-items: center; justify-content: space-between;">
-                        <div style="display: flex; align-items: center; gap: 1rem;">
-                            <div style="font-size: 1.5rem;">{ach['icon']}</div>
-                            <div>
-                                <div style="font-weight: 600; color: {'white' if unlocked else '#1e293b'};">
-                                    {ach['name']}
-                                </div>
-                                <div style="font-size: 0.9rem; color: {'rgba(255,255,255,0.8)' if unlocked else '#64748b'};">
-                                    {ach['desc']}
-                                </div>
-                            </div>
-                        </div>
-                        <div style="background: {'rgba(255,255,255,0.2)' if unlocked else 'white'}; 
-                                    padding: 0.5rem 1rem; border-radius: 20px; font-weight: 600; 
-                                    color: {'white' if unlocked else 'var(--primary)'};">
-                            {ach['xp']} XP
-                        </div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+        render_achievements()
     
     with col_ach2:
         st.markdown("#### 📈 Progress Overview")
@@ -1034,10 +928,10 @@ with tab4:
         progress_data = {
             "Category": ["Sessions", "Quizzes", "Study Time", "Characters"],
             "Progress": [
-                min(len(st.session_state.history) / 10, 1.0),
+                min(total_sessions / 10, 1.0),
                 min(len(st.session_state.quiz_attempts) / 5, 1.0),
                 min(st.session_state.study_time / 60, 1.0),
-                min(sum(len(s['text']) for s in st.session_state.history) / 10000, 1.0)
+                min(history_stats.chars / 10000, 1.0)
             ]
         }
         
@@ -1056,8 +950,8 @@ with tab4:
         
         st.markdown("#### 🎯 Next Milestones")
         milestones = [
-            f"📚 Reach {max(0, 10 - len(st.session_state.history))} more sessions for Bookworm",
-            f"🔥 Maintain streak for {max(0, 3 - get_streak_days(st.session_state.history))} more days",
+            f"📚 Reach {max(0, 10 - total_sessions)} more sessions for Bookworm",
+            f"🔥 Maintain streak for {max(0, 3 - history_stats.streak)} more days",
             f"🎯 Complete {max(0, 5 - len(st.session_state.quiz_attempts))} more quizzes"
         ]
         
@@ -1068,105 +962,173 @@ with tab4:
 # PROCESSING LOGIC
 # ============================================================================
 
-if generate_btn and user_text.strip() and len(user_text.strip()) >= 50:
-    with st.spinner("🤖 Agents are analyzing your content..."):
-        # Show progress animation
-        progress_bar = st.progress(0)
-        status_container = st.empty()
-        
-        # Create session data
-        session_data = {
-            'text': user_text,
-            'explanation': None,
-            'quiz': None,
-            'timestamp': datetime.now().strftime("%H:%M"),
-            'date': datetime.now().date(),
-            'level': explanation_level,
-            'difficulty': quiz_difficulty,
-            'mode': learning_mode
-        }
-        st.session_state.history.append(session_data)
-        
-        # Update progress
-        progress_bar.progress(30)
-        status_container.markdown("""
-        <div class="agent-card">
-            <h4 style="margin:0; color: white;">🦸‍♂️ Agent 1 - Explainer</h4>
-            <p style="margin:0; opacity: 0.9;">Analyzing and simplifying content...</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Generate explanation
-        explanation_obj = explainer_agent(user_text, level=explanation_level)
-        explanation = explanation_obj["explanation_text"]
-        
-        progress_bar.progress(70)
-        status_container.markdown("""
-        <div class="agent-card" style="background: var(--gradient-success);">
-            <h4 style="margin:0; color: white;">🦸‍♀️ Agent 2 - Quiz Master</h4>
-            <p style="margin:0; opacity: 0.9;">Creating interactive questions...</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Generate quiz
-        quiz = quiz_agent(explanation, difficulty=quiz_difficulty, num_questions=num_questions)
-        
-        progress_bar.progress(100)
-        
-        # Update session data
-        st.session_state.history[-1]['explanation'] = explanation
-        st.session_state.history[-1]['quiz'] = quiz
-        
-        # Store for display
-        st.session_state.last_explanation = explanation
-        st.session_state.last_quiz = quiz
-        st.session_state.last_session_data = st.session_state.history[-1]
-        
-        # Update XP and study time
-        st.session_state.xp += 15
+JOB_LABELS = {"full": "✨ Full study session", "explain": "🤖 Explanation", "quiz": "🎯 Quiz"}
+JOB_XP = {"full": 15, "explain": 5, "quiz": 8}
+JOB_SUCCESS = {
+    "full": """
+            🎉 **Study materials generated successfully!**
+            
+            **What's ready:**
+            • 📖 Detailed explanation with key concepts
+            • ❓ Interactive quiz with multiple choice questions
+            • 📊 Session saved to your history
+            • 🏆 +15 XP added to your profile
+            
+            Switch to the **Results** tab to explore!
+            """,
+    "explain": "✅ Explanation ready! Switch to Results tab to view.",
+    "quiz": "✅ Quiz ready! Switch to Results tab to view.",
+}
+OFFLINE_WARNING = "📴 The AI service was unreachable, so these results were built directly from your text. Try again later for AI-written ones."
+
+def queue_job(kind):
+    """Hand the current text to the server-wide job queue; returns without waiting for the LLM."""
+    # "Quiz only" reuses the explanation on screen, but only if it is for this text and level
+    explanation_for = (text_key(user_text), explanation_level)
+    reuse_explanation = kind == "quiz" and st.session_state.last_explanation_for == explanation_for
+    job_id = job_queue.submit(
+        user_id,
+        kind,
+        user_text,
+        level=explanation_level,
+        difficulty=quiz_difficulty,
+        num_questions=num_questions,
+        mode=learning_mode,
+        parallel=parallel_agents,
+        refine=refine_quiz,
+        fused=fused_agent,
+        preview=instant_preview,
+        explanation=st.session_state.last_explanation if reuse_explanation else None,
+        explanation_for=explanation_for if reuse_explanation else None,
+        client_id=client_id
+    )
+    st.session_state.active_jobs.append(job_id)
+    st.toast(f"{JOB_LABELS[kind]} queued. Keep studying while the agents work!")
+
+def apply_finished_job(job):
+    """Move a finished job's results into this session's state."""
+    if job.status == "failed":
+        st.session_state.job_notices.append(("error", describe_llm_error(job.error)))
+        return
+    
+    # Store for display
+    if job.explanation:
+        st.session_state.last_explanation = job.explanation
+        st.session_state.last_explanation_for = (text_key(job.text), job.level)
+    if job.quiz is not None:
+        st.session_state.last_quiz = job.quiz
+    if job.kind == "full":
+        st.session_state.last_session_data = history_store.get(user_id, job.session_id)
         st.session_state.study_time += 10
+    
+    # Update XP
+    st.session_state.xp += JOB_XP[job.kind]
+    st.session_state.job_notices.append(("success", JOB_SUCCESS[job.kind]))
+    if (job.explanation and job.explanation.startswith(OFFLINE_NOTE)) or (job.quiz is not None and job.quiz.offline):
+        st.session_state.job_notices.append(("warning", OFFLINE_WARNING))
+    elif prefetch_quizzes and job.explanation:
+        prefetcher.start(
+            client_id, job.text, job.level, job.explanation, job.num_questions,
+            skip=(job.difficulty,) if job.quiz is not None else ()
+        )
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_active_jobs():
+    """Live status of this session's jobs; polling reruns only this region."""
+    finished_any = False
+    
+    for job_id in list(st.session_state.active_jobs):
+        job = job_queue.get(job_id)
+        if job is None or job.finished:
+            if job is not None:
+                apply_finished_job(job)
+                job_queue.forget(job_id)
+                finished_any = True
+            st.session_state.active_jobs.remove(job_id)
+            continue
         
-        time.sleep(0.5)
-        progress_bar.empty()
-        status_container.empty()
-        
-        # Success message
-        st.success("""
-        🎉 **Study materials generated successfully!**
-        
-        **What's ready:**
-        • 📖 Detailed explanation with key concepts
-        • ❓ Interactive quiz with multiple choice questions
-        • 📊 Session saved to your history
-        • 🏆 +15 XP added to your profile
-        
-        Switch to the **Results** tab to explore!
-        """)
-        
-        # Auto-switch to results tab
-        safe_switch_to_results()
+        with st.container(border=True):
+            st.markdown(f"**{JOB_LABELS[job.kind]}** • {job.submitted_at.strftime('%H:%M:%S')}")
+            
+            if job.status == "queued":
+                ahead = job_queue.queued_ahead(job_id)
+                st.caption(f"⏳ Waiting for a free agent ({ahead} ahead in the queue)...")
+            elif scheduler.depth_for(client_id):
+                st.caption(f"🚦 {scheduler.depth_for(client_id)} of your AI calls waiting for their fair share of the service...")
+            elif job.stage == "fused":
+                st.markdown("""
+                <div class="agent-card">
+                    <h4 style="margin:0; color: white;">🧩 Study Agent - Explainer + Quiz Master</h4>
+                    <p style="margin:0; opacity: 0.9;">Writing the explanation, key points and quiz in a single call...</p>
+                </div>
+                """, unsafe_allow_html=True)
+            elif job.stage == "pipeline":
+                st.markdown("""
+                <div class="agent-card">
+                    <h4 style="margin:0; color: white;">🦸 Agents 1 & 2 - Explainer + Quiz Master</h4>
+                    <p style="margin:0; opacity: 0.9;">Simplifying content and creating questions in parallel...</p>
+                </div>
+                """, unsafe_allow_html=True)
+            elif job.stage == "explain":
+                st.markdown("""
+                <div class="agent-card">
+                    <h4 style="margin:0; color: white;">🦸‍♂️ Agent 1 - Explainer</h4>
+                    <p style="margin:0; opacity: 0.9;">Analyzing and simplifying content...</p>
+                </div>
+                """, unsafe_allow_html=True)
+                if job.partial_explanation:
+                    st.markdown(job.partial_explanation)
+            elif job.stage == "quiz":
+                st.markdown("""
+                <div class="agent-card" style="background: var(--gradient-success);">
+                    <h4 style="margin:0; color: white;">🦸‍♀️ Agent 2 - Quiz Master</h4>
+                    <p style="margin:0; opacity: 0.9;">Creating interactive questions...</p>
+                </div>
+                """, unsafe_allow_html=True)
+                written = job.questions_written
+                st.progress(written / job.num_questions, text=f"🎯 Writing question {written} of {job.num_questions}...")
+            
+            if job.preview_text and not job.partial_explanation and job.stage != "quiz":
+                with st.expander("⚡ Instant preview", expanded=True):
+                    st.caption("Picked straight from your text while the agents write the full explanation")
+                    st.markdown(job.preview_text)
+    
+    if finished_any:
+        # Results, history and XP live outside this fragment
+        st.rerun()
 
-elif explain_only and user_text.strip() and len(user_text.strip()) >= 50:
-    with st.spinner("🤖 Generating explanation..."):
-        explanation_obj = explainer_agent(user_text, level=explanation_level)
-        st.session_state.last_explanation = explanation_obj["explanation_text"]
-        st.session_state.xp += 5
-        st.success("✅ Explanation ready! Switch to Results tab to view.")
-        safe_switch_to_results()
+# Quizzes prefetched for text the user has moved on from would never be used
+if prefetch_quizzes:
+    prefetcher.follow_text(client_id, user_text)
+else:
+    prefetcher.cancel(client_id)
 
-elif quiz_only and user_text.strip() and len(user_text.strip()) >= 50:
-    with st.spinner("🤖 Creating quiz..."):
-        if not st.session_state.last_explanation:
-            explanation_obj = explainer_agent(user_text, level=explanation_level)
-            explanation = explanation_obj["explanation_text"]
-            st.session_state.last_explanation = explanation
-        
-        quiz = quiz_agent(st.session_state.last_explanation, difficulty=quiz_difficulty, num_questions=num_questions)
-        st.session_state.last_quiz = quiz
-        st.session_state.xp += 8
-        st.success("✅ Quiz ready! Switch to Results tab to view.")
+if user_text.strip() and len(user_text.strip()) >= 50:
+    if generate_btn:
+        queue_job("full")
+    elif explain_only:
+        queue_job("explain")
+    elif quiz_only:
+        queue_job("quiz")
+
+for notice_type, message in st.session_state.job_notices:
+    if notice_type == "success":
+        st.success(message)
+    elif notice_type == "warning":
+        st.warning(message)
+    else:
+        st.error(message)
+if st.session_state.job_notices:
+    succeeded = any(notice_type == "success" for notice_type, _ in st.session_state.job_notices)
+    st.session_state.job_notices = []
+    if succeeded:
+        # Auto-switch to results tab
         safe_switch_to_results()
 
+if st.session_state.active_jobs:
+    st.markdown("### ⏳ Agents at Work")
+    render_active_jobs()
+
 # ============================================================================
 # FOOTER
 # ============================================================================
@@ -1195,34 +1157,13 @@ st.markdown("""
 """.format(
     date=datetime.now().strftime('%Y-%m-%d'),
     study_time=st.session_state.study_time,
-    streak=get_streak_days(st.session_state.history),
+    streak=history_stats.streak,
     level=st.session_state.user_level
 ), unsafe_allow_html=True)
 
 # Floating Action Button
 st.markdown("""
 <div style="position: fixed; bottom: 20px; right: 20px; z-index: 999;">
-    <style>
-    .fab-btn {
-        background: var(--gradient);
-        color: white;
-        border: none;
-        border-radius: 50%;
-        width: 60px;
-        height: 60px;
-        font-size: 1.5rem;
-        cursor: pointer;
-        box-shadow: 0 6px 20px rgba(102, 126, 234, 0.4);
-        transition: all 0.3s ease;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-    }
-    .fab-btn:hover {
-        transform: scale(1.1) rotate(5deg);
-        box-shadow: 0 10px 30px rgba(102, 126, 234, 0.6);
-    }
-    </style>
     <button class="fab-btn" onclick="window.scrollTo({top: 0, behavior: 'smooth'})">↑</button>
 </div>
 """, unsafe_allow_html=True)
\ No newline at end of file
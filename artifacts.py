@@ -0,0 +1,132 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from offline import OFFLINE_NOTE
+from quiz_model import Quiz, parse_quiz
+from text_processing import clean_text
+
+DEFAULT_ARTIFACTS_PATH = os.path.join("data", "study_buddy.sqlite3")
+DEFAULT_MAX_ENTRIES = 20000
+
+EXPLANATION = "explanation"
+QUIZ = "quiz"
+
+
+def text_key(text: str) -> str:
+    """Hash of the normalized text, so re-pasted or re-extracted copies of a passage share artifacts."""
+    return hashlib.sha256(clean_text(text).text.encode("utf-8")).hexdigest()
+
+
+class ArtifactStore:
+    """Generated explanations and quizzes per (text, level), shared by every generation path.
+
+    "Generate", "Explain only" and "Quiz only" all look here first, so each
+    stage runs at most once per input however the user gets to it.
+    """
+
+    def __init__(self, path: str = DEFAULT_ARTIFACTS_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS artifacts (
+                text_key TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                level TEXT NOT NULL,
+                difficulty TEXT NOT NULL DEFAULT '',
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (text_key, kind, level, difficulty)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_last_access ON artifacts(last_access)")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> "ArtifactStore":
+        return cls(
+            path=os.getenv("STUDY_BUDDY_ARTIFACTS_PATH", os.getenv("STUDY_BUDDY_DB_PATH", DEFAULT_ARTIFACTS_PATH)),
+            max_entries=int(os.getenv("STUDY_BUDDY_ARTIFACTS_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        )
+
+    def _get(self, key: str, kind: str, level: str, difficulty: str = ""):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM artifacts WHERE text_key = ? AND kind = ? AND level = ? AND difficulty = ?",
+                (key, kind, level or "", difficulty or ""),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE artifacts SET last_access = ? WHERE text_key = ? AND kind = ? AND level = ? AND difficulty = ?",
+                (time.time(), key, kind, level or "", difficulty or ""),
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def _put(self, key: str, kind: str, level: str, value: str, difficulty: str = "", size: int = 0) -> None:
+        """Store `value`, unless a larger one (by `size`) is already there."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO artifacts (text_key, kind, level, difficulty, value, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (text_key, kind, level, difficulty) DO UPDATE SET "
+                "value = excluded.value, size = excluded.size, last_access = excluded.last_access "
+                "WHERE excluded.size >= artifacts.size",
+                (key, kind, level or "", difficulty or "", value, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM artifacts").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM artifacts WHERE rowid IN "
+                "(SELECT rowid FROM artifacts ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def explanation(self, key: str, level: str):
+        return self._get(key, EXPLANATION, level)
+
+    def put_explanation(self, key: str, level: str, explanation: str) -> None:
+        # Offline summaries are stand-ins; the next run should ask the LLM again
+        if explanation and not explanation.startswith(OFFLINE_NOTE):
+            self._put(key, EXPLANATION, level, explanation)
+
+    def quiz(self, key: str, level: str, difficulty: str, num_questions: int):
+        """The stored quiz cut to `num_questions`, or None; it may be shorter, for the quiz agent to extend."""
+        raw = self._get(key, QUIZ, level, difficulty)
+        if raw is None:
+            return None
+        quiz = parse_quiz(raw, difficulty)
+        return Quiz(questions=quiz.questions[:num_questions], difficulty=quiz.difficulty)
+
+    def put_quiz(self, key: str, level: str, quiz: Quiz) -> None:
+        # The longest quiz wins, so a 10-question run also serves later 5-question ones
+        if len(quiz) and not quiz.offline:
+            self._put(key, QUIZ, level, quiz.to_json(), quiz.difficulty, size=len(quiz))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM artifacts")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
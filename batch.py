@@ -0,0 +1,97 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from scheduler import BATCH, llm_context
+from study_buddy import explainer_agent, quiz_agent
+
+TEXT_EXTENSIONS = (".txt", ".md")
+
+
+def iter_passages(source: str):
+    """Yield (id, text) from a directory of text files or a JSONL file of passages."""
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if os.path.isfile(path) and name.lower().endswith(TEXT_EXTENSIONS):
+                with open(path, encoding="utf-8") as f:
+                    yield os.path.splitext(name)[0], f.read()
+        return
+
+    with open(source, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                print(f"{source}:{line_number}: skipped, not a JSON object", file=sys.stderr)
+                continue
+            text = record.get("text") or record.get("passage") or ""
+            yield str(record.get("id", line_number)), text
+
+
+def completed_ids(output_path: str) -> set:
+    """Ids already written successfully, so an interrupted run can resume."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by the interruption
+            if not isinstance(record, dict):
+                continue
+            # Offline summaries are stand-ins; a resumed run asks the LLM again
+            if "error" not in record and not record.get("offline"):
+                done.add(str(record.get("id")))
+    return done
+
+
+def process_passage(passage_id: str, text: str, level: str, difficulty: str, num_questions: int) -> dict:
+    record = {"id": passage_id, "level": level, "difficulty": difficulty, "num_questions": num_questions}
+    try:
+        # Batch calls yield to anyone using the app
+        with llm_context("batch", BATCH):
+            result = explainer_agent(text, level=level)
+            explanation = result["explanation_text"]
+            quiz = quiz_agent(explanation, difficulty=difficulty, num_questions=num_questions)
+    except Exception as exc:
+        # A failing passage becomes an error record (retried on resume); the rest of the run goes on
+        record["error"] = f"{type(exc).__name__}: {exc}"
+        return record
+    if result.get("offline") or quiz.offline:
+        record["offline"] = True
+    record["explanation"] = explanation
+    record["quiz"] = quiz.to_dict()
+    return record
+
+
+def run_batch(source: str, output_path: str, level: str = "Intermediate", difficulty: str = "Medium",
+              num_questions: int = 5, workers: int = 4) -> dict:
+    """Explain and quiz every passage in `source`, appending one JSON line per result as it completes."""
+    done = completed_ids(output_path)
+    pending = [(pid, text) for pid, text in iter_passages(source) if pid not in done and text.strip()]
+    counts = {"skipped": len(done), "ok": 0, "failed": 0}
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(process_passage, pid, text, level, difficulty, num_questions): pid
+            for pid, text in pending
+        }
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            counts["failed" if "error" in record else "ok"] += 1
+            print(f"[{counts['ok'] + counts['failed']}/{len(pending)}] {record['id']}: "
+                  f"{record.get('error', 'ok')}", file=sys.stderr)
+    return counts
@@ -0,0 +1,147 @@
+import json
+import os
+from dataclasses import dataclass
+
+from artifacts import ArtifactStore, text_key
+from llm_client import LLMError
+from quiz_model import EXPLANATION_LEVELS, QUIZ_DIFFICULTIES, parse_quiz
+from scheduler import BATCH, llm_context
+from study_buddy import explainer_agent, quiz_agent
+
+DEFAULT_BUNDLE_PATH = os.path.join("assets", "examples_bundle.json")
+# Bump when the bundle layout changes; bundles of another version are ignored
+BUNDLE_VERSION = 1
+
+# The sidebar's largest quiz; shorter quizzes are served by cutting this one
+BUNDLE_QUESTIONS = 20
+
+
+@dataclass(frozen=True, slots=True)
+class Example:
+    emoji: str
+    subject: str
+    topic: str
+    text: str
+
+
+EXAMPLES = (
+    Example("🌱", "Biology", "Photosynthesis process in plants", (
+        "Photosynthesis is the process by which plants convert sunlight into chemical energy. "
+        "It takes place mainly in the chloroplasts of leaf cells, where the green pigment chlorophyll absorbs light. "
+        "In the light-dependent reactions, water is split, oxygen is released and the energy carriers ATP and NADPH "
+        "are made. In the Calvin cycle, the plant uses that ATP and NADPH to fix carbon dioxide from the air into "
+        "glucose. Glucose fuels the plant's growth and is stored as starch. Photosynthesis is the source of almost "
+        "all the oxygen in the atmosphere and of the food energy in nearly every food chain."
+    )),
+    Example("⚛️", "Physics", "Newton's Laws of Motion", (
+        "Newton's First Law states that an object at rest stays at rest, and an object in motion keeps moving in a "
+        "straight line at constant speed, unless a net force acts on it. This tendency to resist changes in motion "
+        "is called inertia. The Second Law says that the acceleration of an object equals the net force on it "
+        "divided by its mass, usually written F = ma, so the same push accelerates a light object more than a "
+        "heavy one. The Third Law states that for every action there is an equal and opposite reaction: when one "
+        "object pushes on another, the second pushes back with a force of the same size in the opposite direction. "
+        "Together these laws explain everyday motion, from a rolling ball to a rocket launch."
+    )),
+    Example("💻", "Computer Science", "Machine Learning basics", (
+        "Machine Learning is a subset of AI that enables computers to learn patterns from data instead of following "
+        "hand-written rules. In supervised learning, a model is trained on labelled examples, such as emails marked "
+        "spam or not spam, and learns to predict labels for new inputs. In unsupervised learning, the model finds "
+        "structure in unlabelled data, for example by grouping similar customers into clusters. Training adjusts "
+        "the model's parameters to reduce a loss function that measures its errors. A model that memorises its "
+        "training data but fails on new data is overfitting, so performance is always checked on a separate test "
+        "set. Common models include linear regression, decision trees and neural networks."
+    )),
+    Example("📊", "Economics", "Supply and demand principles", (
+        "Supply and demand is an economic model of price determination in a market. Demand is the quantity of a "
+        "good that buyers are willing to purchase at each price; as the price rises, the quantity demanded usually "
+        "falls. Supply is the quantity that sellers are willing to offer at each price; as the price rises, the "
+        "quantity supplied usually increases. The market settles at the equilibrium price, where quantity demanded "
+        "equals quantity supplied. If the price is above equilibrium there is a surplus, which pushes the price "
+        "down; below it there is a shortage, which pushes the price up. Changes in income, tastes, costs or "
+        "technology shift the curves and move the equilibrium."
+    )),
+    Example("📚", "Literature", "Literary analysis techniques", (
+        "Literary analysis involves examining the elements of a literary text to understand how it creates meaning. "
+        "Readers look at theme, the central idea or message the work explores, and at characterization, the way "
+        "an author reveals what characters are like through their actions, speech and thoughts. Setting places the "
+        "story in time and space and often shapes its mood. Point of view determines whose perspective the reader "
+        "shares, and an unreliable narrator can make the reader question events. Figurative language such as "
+        "metaphor, simile and symbolism adds layers of meaning. A strong analysis makes a clear claim about the "
+        "text and supports it with quoted evidence."
+    )),
+)
+
+
+def load_bundle(path: str = DEFAULT_BUNDLE_PATH) -> dict:
+    """Prebuilt example entries keyed by (text key, level); empty if the file is missing or outdated."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != BUNDLE_VERSION:
+        return {}
+    return {(entry["text_key"], entry["level"]): entry for entry in data.get("entries") or []}
+
+
+def seed_artifacts(artifacts: ArtifactStore, path: str = DEFAULT_BUNDLE_PATH) -> int:
+    """Copy the bundle into the artifact store, so example sessions are served without LLM calls."""
+    current = {text_key(example.text) for example in EXAMPLES}
+    seeded = 0
+    for (key, level), entry in load_bundle(path).items():
+        # Entries for example texts that have since been edited would never be looked up
+        if key not in current:
+            continue
+        artifacts.put_explanation(key, level, entry.get("explanation") or "")
+        for difficulty, quiz in (entry.get("quizzes") or {}).items():
+            artifacts.put_quiz(key, level, parse_quiz(quiz, difficulty))
+        seeded += 1
+    return seeded
+
+
+def build_bundle(path: str = DEFAULT_BUNDLE_PATH, num_questions: int = BUNDLE_QUESTIONS) -> dict:
+    """Generate every example at every level and difficulty into `path`; finished entries are kept."""
+    existing = load_bundle(path)
+    entries, counts = [], {"built": 0, "kept": 0, "failed": 0}
+    with llm_context("bundle", BATCH):
+        for example in EXAMPLES:
+            key = text_key(example.text)
+            for level in EXPLANATION_LEVELS:
+                entry = existing.get((key, level)) or {"text_key": key, "level": level, "subject": example.subject}
+                quizzes = entry.setdefault("quizzes", {})
+                if entry.get("explanation") and all(
+                    len(parse_quiz(quizzes.get(difficulty), difficulty)) >= num_questions
+                    for difficulty in QUIZ_DIFFICULTIES
+                ):
+                    entries.append(entry)
+                    counts["kept"] += 1
+                    continue
+
+                try:
+                    if not entry.get("explanation"):
+                        result = explainer_agent(example.text, level=level)
+                        if result.get("offline"):
+                            raise LLMError("explainer unavailable")
+                        entry["explanation"] = result["explanation_text"]
+                    for difficulty in QUIZ_DIFFICULTIES:
+                        quiz = quiz_agent(entry["explanation"], difficulty=difficulty, num_questions=num_questions,
+                                          existing=parse_quiz(quizzes.get(difficulty), difficulty))
+                        if quiz.offline:
+                            raise LLMError("quiz agent unavailable")
+                        quizzes[difficulty] = quiz.to_dict()
+                except LLMError:
+                    # Whatever was made is kept; the next build fills in the rest
+                    counts["failed"] += 1
+                else:
+                    counts["built"] += 1
+                if entry.get("explanation"):
+                    entries.append(entry)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": BUNDLE_VERSION, "entries": entries}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+    return counts
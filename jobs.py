@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from artifacts import ArtifactStore, text_key
+from offline import offline_explanation
+from quiz_model import parse_quiz
+from scheduler import INTERACTIVE, llm_context
+from storage import HistoryStore
+from study_buddy import (
+    explainer_agent, explainer_agent_stream, fused_study_agent, quiz_agent, quiz_agent_stream, run_async,
+    study_pipeline
+)
+
+DEFAULT_WORKERS = int(os.getenv("STUDY_BUDDY_JOB_WORKERS", "4"))
+
+# Finished jobs stay readable this long so a reconnecting tab can still pick up its results
+FINISHED_TTL_SECONDS = 3600
+
+JOB_KINDS = ("full", "explain", "quiz")
+
+
+@dataclass(slots=True)
+class Job:
+    id: str
+    user_id: str
+    kind: str
+    text: str
+    level: str
+    difficulty: str
+    num_questions: int
+    mode: str = ""
+    client_id: str = ""  # the browser session that queued it; scheduling and job lists go by this
+    parallel: bool = True
+    refine: bool = False
+    fused: bool = False
+    preview: bool = False
+    preview_text: str = ""
+    explanation: str = None
+    explanation_for: tuple = None  # (text key, level) the given explanation was written for
+    quiz: object = None
+    status: str = "queued"  # queued -> running -> done | failed
+    stage: str = ""
+    partial_explanation: str = ""
+    partial_quiz: str = ""
+    error: Exception = None
+    session_id: int = None
+    submitted_at: datetime = field(default_factory=datetime.now)
+    finished_at: float = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def questions_written(self) -> int:
+        return min(self.partial_quiz.count('"question"'), self.num_questions)
+
+
+class JobQueue:
+    """Server-wide worker pool running study generations off the Streamlit script thread."""
+
+    def __init__(self, history_store: HistoryStore, artifacts: ArtifactStore, workers: int = DEFAULT_WORKERS):
+        self.history_store = history_store
+        self.artifacts = artifacts
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="study-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user_id: str, kind: str, text: str, level: str, difficulty: str, num_questions: int,
+               mode: str = "", parallel: bool = True, refine: bool = False, fused: bool = False,
+               preview: bool = False, explanation: str = None, explanation_for: tuple = None,
+               client_id: str = None) -> str:
+        """Queue a generation for `user_id`'s history and return its job id immediately."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind!r}")
+        job = Job(
+            id=uuid.uuid4().hex, user_id=user_id, kind=kind, text=text, level=level,
+            difficulty=difficulty, num_questions=num_questions, mode=mode, client_id=client_id or user_id,
+            parallel=parallel,
+            refine=refine, fused=fused, preview=preview, explanation=explanation or None,
+            explanation_for=explanation_for,
+        )
+        if preview and kind != "quiz":
+            # Extractive summary to read while the job waits and runs; takes milliseconds
+            job.preview_text = offline_explanation(text, level, note=None)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job.id
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queued_ahead(self, job_id: str) -> int:
+        """How many queued jobs were submitted before this one."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return 0
+            return sum(1 for other in self._jobs.values()
+                       if other.status == "queued" and other.submitted_at < job.submitted_at)
+
+    def forget(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - FINISHED_TTL_SECONDS
+        for job_id in [jid for jid, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Job) -> None:
+        job.status = "running"
+        try:
+            # Someone is waiting on this job: its calls are interactive and count against its session's share
+            with llm_context(job.client_id, INTERACTIVE):
+                self._generate(job)
+            status = "done"
+        except Exception as exc:
+            job.error = exc
+            status = "failed"
+        job.finished_at = time.time()
+        job.status = status
+
+    def _generate(self, job: Job) -> None:
+        key = text_key(job.text)
+        # Whatever any earlier job already made for this text and level is reused, not regenerated
+        stored = self.artifacts.explanation(key, job.level)
+        # A caller's explanation is only used for the text and level it was written for
+        given = job.explanation if job.explanation_for == (key, job.level) else None
+        job.explanation = stored or given
+        known_explanation = job.explanation
+        if job.kind != "explain":
+            job.quiz = self.artifacts.quiz(key, job.level, job.difficulty, job.num_questions)
+        needs_explanation = job.kind != "quiz" and not job.explanation
+        # A stored quiz shorter than asked for is extended, keeping the questions it has
+        needs_quiz = job.kind != "explain" and (job.quiz is None or len(job.quiz) < job.num_questions)
+
+        if job.kind == "full" and needs_explanation and job.quiz is None and job.fused:
+            job.stage = "fused"
+            result = fused_study_agent(
+                job.text, level=job.level, difficulty=job.difficulty, num_questions=job.num_questions,
+            )
+            job.explanation, job.quiz = result["explanation_text"], result["quiz"]
+        elif job.kind == "full" and needs_explanation and job.quiz is None and job.parallel:
+            job.stage = "pipeline"
+            result = run_async(study_pipeline(
+                job.text, level=job.level, difficulty=job.difficulty,
+                num_questions=job.num_questions, refine=job.refine,
+            ))
+            job.explanation, job.quiz = result["explanation_text"], result["quiz"]
+        elif job.kind == "full" and (job.fused or job.parallel):
+            # Only one half is missing: one non-streamed call fills it
+            if needs_explanation:
+                job.stage = "explain"
+                job.explanation = explainer_agent(job.text, level=job.level)["explanation_text"]
+            if needs_quiz:
+                job.stage = "quiz"
+                job.quiz = quiz_agent(job.explanation, difficulty=job.difficulty, num_questions=job.num_questions,
+                                      existing=job.quiz)
+        else:
+            if not job.explanation and (needs_explanation or needs_quiz):
+                job.stage = "explain"
+                for token in explainer_agent_stream(job.text, level=job.level):
+                    job.partial_explanation += token
+                job.explanation = job.partial_explanation.strip()
+            if needs_quiz:
+                job.stage = "quiz"
+                if job.quiz is None:
+                    for token in quiz_agent_stream(job.explanation, difficulty=job.difficulty,
+                                                   num_questions=job.num_questions):
+                        job.partial_quiz += token
+                    job.quiz = parse_quiz(job.partial_quiz, job.difficulty)
+                if len(job.quiz) < job.num_questions:
+                    job.quiz = quiz_agent(job.explanation, difficulty=job.difficulty,
+                                          num_questions=job.num_questions, existing=job.quiz)
+
+        if job.explanation != known_explanation:
+            self.artifacts.put_explanation(key, job.level, job.explanation)
+        if needs_quiz and job.quiz is not None:
+            self.artifacts.put_quiz(key, job.level, job.quiz)
+
+        if job.kind == "full":
+            # Only completed full sessions are saved to history
+            job.session_id = self.history_store.add(job.user_id, {
+                'text': job.text,
+                'explanation': job.explanation,
+                'quiz': job.quiz,
+                'timestamp': job.submitted_at.strftime("%H:%M"),
+                'date': job.submitted_at.date(),
+                'level': job.level,
+                'difficulty': job.difficulty,
+                'mode': job.mode,
+            })
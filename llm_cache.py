@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "llm_responses.sqlite3")
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def make_cache_key(model: str, system_prompt: str, user_prompt: str, temperature: float) -> str:
+    """Content address of a completion request: same inputs, same key."""
+    payload = json.dumps(
+        [model, system_prompt, user_prompt, round(float(temperature), 4)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Disk-backed LRU/TTL cache for LLM completions.
+
+    Lives in a SQLite file so entries survive Streamlit reruns and server
+    restarts, and can be shared by several server processes.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            path=os.getenv("STUDY_BUDDY_CACHE_PATH", DEFAULT_CACHE_PATH),
+            ttl_seconds=float(os.getenv("STUDY_BUDDY_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+            max_entries=int(os.getenv("STUDY_BUDDY_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+            max_bytes=int(float(os.getenv("STUDY_BUDDY_CACHE_MAX_MB", DEFAULT_MAX_BYTES / 1024 / 1024)) * 1024 * 1024),
+        )
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        # Walk from least recently used until both caps are satisfied
+        stale = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            stale.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total,
+        }
+
+
+class FlightCancelled(Exception):
+    """The leader gave up before landing; followers should retry, one of them leading."""
+
+
+class Flight:
+    """One upstream completion that concurrent identical requests wait on together."""
+
+    def __init__(self, on_land, rank: int = 0):
+        self.rank = rank  # urgency of the leader's caller; lower is more urgent
+        self.parts = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.future = Future()  # completes with the result, for async followers
+        self._on_land = on_land
+        self._cond = threading.Condition()
+
+    def push(self, part: str) -> None:
+        """Publish a streamed piece to followers."""
+        with self._cond:
+            self.parts.append(part)
+            self._cond.notify_all()
+
+    def finish(self, result: str) -> None:
+        self._land(result=result)
+
+    def fail(self, error: Exception) -> None:
+        self._land(error=error)
+
+    def cancel(self) -> None:
+        """Drop the flight without a result; waiting followers get `FlightCancelled`."""
+        self._land(error=FlightCancelled("The shared request was cancelled before it finished"))
+
+    def _land(self, result: str = None, error: Exception = None) -> None:
+        self._on_land(self)
+        with self._cond:
+            self.result, self.error, self.done = result, error, True
+            self._cond.notify_all()
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(result)
+
+    def wait(self) -> str:
+        """Block until the leader lands; return its result or raise its error."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.done)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def follow(self):
+        """Yield the leader's pieces as they arrive, including those already sent."""
+        sent = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.done or len(self.parts) > sent)
+                parts, done = self.parts[sent:], self.done
+            sent += len(parts)
+            yield from parts
+            if done:
+                break
+        if self.error is not None:
+            raise self.error
+        if not self.parts and self.result:
+            # The leader did not stream; hand over the whole result
+            yield self.result
+
+
+class SingleFlight:
+    """Coalesces concurrent identical requests so only one reaches the provider."""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str, rank: int = 0) -> tuple:
+        """Return ``(flight, is_leader)``; the leader must `finish`, `fail` or `cancel` the flight.
+
+        A caller never waits behind a less urgent (higher `rank`) leader, which the
+        scheduler may hold back or its owner may cancel; it leads a new flight instead.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.rank <= rank:
+                self.coalesced += 1
+                return flight, False
+            flight = Flight(on_land=lambda landed: self._land(key, landed), rank=rank)
+            self._flights[key] = flight
+            return flight, True
+
+    def _land(self, key: str, flight: Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
@@ -0,0 +1,632 @@
+import asyncio
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import groq
+import httpx
+from dotenv import load_dotenv
+from groq import AsyncGroq, Groq
+
+from scheduler import carry_context, scheduler
+from text_processing import estimate_tokens
+
+load_dotenv()
+
+DEFAULT_TIMEOUT = float(os.getenv("STUDY_BUDDY_LLM_TIMEOUT", 30))
+MAX_RETRIES = int(os.getenv("STUDY_BUDDY_LLM_RETRIES", 3))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=120)
+
+# Groq quota for the key; 0 disables that limit
+REQUESTS_PER_MINUTE = int(os.getenv("STUDY_BUDDY_RPM", 30))
+TOKENS_PER_MINUTE = int(os.getenv("STUDY_BUDDY_TPM", 12000))
+# Completion tokens assumed for a call that does not set max_tokens, until its usage is known
+DEFAULT_COMPLETION_TOKENS = 800
+
+# Hedging: resend a completion that is slower than this percentile of recent ones
+HEDGE_ENABLED = os.getenv("STUDY_BUDDY_HEDGE", "0").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("STUDY_BUDDY_HEDGE_PERCENTILE", 95))
+# Hedges allowed per primary request, so hedging adds at most ~10% load
+HEDGE_BUDGET_RATIO = float(os.getenv("STUDY_BUDDY_HEDGE_BUDGET", 0.1))
+HEDGE_MIN_DELAY = 0.5
+
+
+# ============================================================================
+# ERRORS
+# ============================================================================
+
+class LLMError(Exception):
+    """Base class for failures talking to the LLM provider."""
+
+
+class LLMAuthError(LLMError):
+    """The API key is missing or was rejected."""
+
+
+class LLMRateLimitError(LLMError):
+    """The provider kept answering 429 after all retries."""
+
+
+class LLMTimeoutError(LLMError):
+    """The request did not finish within its timeout."""
+
+
+class LLMUnavailableError(LLMError):
+    """The provider could not be reached or kept failing with 5xx."""
+
+
+class LLMCircuitOpenError(LLMUnavailableError):
+    """Calls are short-circuited while the provider is known to be failing."""
+
+
+class LLMRequestError(LLMError):
+    """The provider rejected the request itself (bad model, prompt too long, ...)."""
+
+
+def classify_error(exc: Exception) -> LLMError:
+    """Map a Groq SDK exception onto one of the errors above."""
+    if isinstance(exc, LLMError):
+        return exc
+    if isinstance(exc, groq.GroqError) and not isinstance(exc, groq.APIError):
+        # Raised by the client itself before any request, i.e. no GROQ_API_KEY
+        return LLMAuthError(str(exc))
+    if isinstance(exc, groq.APITimeoutError):
+        return LLMTimeoutError(str(exc))
+    if isinstance(exc, groq.APIConnectionError):
+        return LLMUnavailableError(str(exc))
+    if isinstance(exc, (groq.AuthenticationError, groq.PermissionDeniedError)):
+        return LLMAuthError(str(exc))
+    if isinstance(exc, groq.RateLimitError):
+        return LLMRateLimitError(str(exc))
+    if isinstance(exc, groq.APIStatusError) and exc.status_code >= 500:
+        return LLMUnavailableError(str(exc))
+    return LLMRequestError(str(exc))
+
+
+def _is_retryable(exc: Exception, retry_rate_limited: bool = True) -> bool:
+    if isinstance(exc, groq.RateLimitError):
+        return retry_rate_limited
+    if isinstance(exc, groq.APIConnectionError):
+        return True
+    return isinstance(exc, groq.APIStatusError) and exc.status_code >= 500
+
+
+def _trips_breaker(exc: Exception) -> bool:
+    # 429s mean "slow down", not "the service is down"
+    return _is_retryable(exc) and not isinstance(exc, groq.RateLimitError)
+
+
+def _backoff_delay(attempt: int, exc: Exception) -> float:
+    retry_after = None
+    response = getattr(exc, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = None
+    # Full jitter keeps many sessions that failed together from retrying together
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, BACKOFF_CAP))
+    return delay
+
+
+# ============================================================================
+# CIRCUIT BREAKER
+# ============================================================================
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one trial call through after a cool-down."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def admit(self):
+        """"closed" or "trial" if a call may go out, None if it must not."""
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_flight:
+                return None
+            self._trial_in_flight = True
+            return "trial"
+
+    def allow(self) -> bool:
+        return self.admit() is not None
+
+    def release_trial(self) -> None:
+        """Give back a trial that ended without a verdict (e.g. cancelled), so the next call can try."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+breaker = CircuitBreaker()
+
+
+# ============================================================================
+# RATE LIMITING
+# ============================================================================
+
+def estimate_request_tokens(messages: list, max_tokens: int = None) -> int:
+    """Tokens a call will count against TPM: the prompt plus the completion it may write."""
+    prompt = sum(estimate_tokens(m.get("content") or "") + 4 for m in messages)
+    return prompt + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, shared by every caller.
+
+    Callers reserve capacity up front and sleep until it is theirs, so bursts are
+    spread out at the quota rate instead of being rejected with 429s. With `path`
+    the buckets live in SQLite and are shared by every process using that file;
+    `scope` keeps limiters for different models apart there.
+    """
+
+    def __init__(self, requests_per_minute: int = REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = TOKENS_PER_MINUTE, path: str = None, max_wait: float = 60.0,
+                 scope: str = ""):
+        self.scope = scope
+        self.limits = {
+            name: per_minute
+            for name, per_minute in (("requests", requests_per_minute), ("tokens", tokens_per_minute))
+            if per_minute > 0
+        }
+        self.max_wait = max_wait
+        self.waited = 0.0
+        self._levels = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit, so each reservation is one explicit BEGIN IMMEDIATE transaction
+            self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, level REAL, updated REAL)"
+            )
+
+    @classmethod
+    def from_env(cls, scope: str = "") -> "RateLimiter":
+        return cls(
+            path=os.getenv("STUDY_BUDDY_RATE_LIMIT_PATH") or None,
+            max_wait=float(os.getenv("STUDY_BUDDY_RATE_LIMIT_MAX_WAIT", 60)),
+            scope=scope,
+        )
+
+    def _row_name(self, bucket: str) -> str:
+        return f"{self.scope}:{bucket}" if self.scope else bucket
+
+    def _apply(self, levels: dict, costs: dict, now: float, max_wait: float) -> float:
+        """Debit `costs` from the refilled buckets in `levels`; return the wait until they are covered."""
+        updated, delay = {}, 0.0
+        for name, cost in costs.items():
+            per_minute = self.limits.get(name)
+            if not per_minute:
+                continue
+            level, last = levels.get(name, (per_minute, now))
+            # A single call larger than the whole bucket would otherwise never fit
+            level = min(per_minute, level + (now - last) * per_minute / 60) - min(cost, per_minute)
+            updated[name] = (level, now)
+            if level < 0:
+                delay = max(delay, -level * 60 / per_minute)
+        if max_wait is not None and delay > max_wait:
+            raise LLMRateLimitError(f"Rate limit queue is {delay:.0f}s long; try again shortly")
+        levels.update(updated)
+        return delay
+
+    def _transact(self, costs: dict, max_wait: float = None) -> float:
+        now = time.time()
+        with self._lock:
+            if self._conn is None:
+                return self._apply(self._levels, costs, now, max_wait)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                buckets = {self._row_name(bucket): bucket for bucket in self.limits}
+                rows = self._conn.execute(
+                    f"SELECT name, level, updated FROM rate_buckets WHERE name IN ({', '.join('?' * len(buckets))})",
+                    tuple(buckets),
+                )
+                levels = {buckets[name]: (level, updated) for name, level, updated in rows}
+                delay = self._apply(levels, costs, now, max_wait)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO rate_buckets (name, level, updated) VALUES (?, ?, ?)",
+                    [(self._row_name(bucket), level, updated) for bucket, (level, updated) in levels.items()],
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return delay
+
+    def reserve(self, tokens: int) -> float:
+        """Claim one request and `tokens` tokens; returns how long to wait before sending."""
+        delay = self._transact({"requests": 1, "tokens": tokens}, self.max_wait)
+        self.waited += delay
+        return delay
+
+    def refund(self, tokens: int) -> None:
+        """Give back a reservation whose call was never sent."""
+        self._transact({"requests": -1, "tokens": -tokens})
+
+    def acquire(self, tokens: int) -> None:
+        delay = self.reserve(tokens)
+        if delay:
+            try:
+                time.sleep(delay)
+            except BaseException:
+                self.refund(tokens)
+                raise
+
+    async def acquire_async(self, tokens: int) -> None:
+        delay = self.reserve(tokens)
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled while queued (hedge loser, prefetch): the call never goes out
+                self.refund(tokens)
+                raise
+
+    def _current_levels(self, now: float) -> dict:
+        with self._lock:
+            if self._conn is None:
+                levels = dict(self._levels)
+            else:
+                buckets = {self._row_name(bucket): bucket for bucket in self.limits}
+                rows = self._conn.execute(
+                    f"SELECT name, level, updated FROM rate_buckets WHERE name IN ({', '.join('?' * len(buckets))})",
+                    tuple(buckets),
+                )
+                levels = {buckets[name]: (level, updated) for name, level, updated in rows}
+        return {
+            name: min(per_minute, level + (now - last) * per_minute / 60)
+            for name, per_minute in self.limits.items()
+            for level, last in [levels.get(name, (per_minute, now))]
+        }
+
+    def headroom(self) -> float:
+        """Fraction of the emptier bucket available right now, 0.0 to 1.0; reserves nothing."""
+        levels = self._current_levels(time.time())
+        return min([1.0] + [max(0.0, levels[name]) / per_minute for name, per_minute in self.limits.items()])
+
+    def would_wait(self, tokens: int) -> bool:
+        """Whether a call reserving `tokens` now would have to queue; reserves nothing."""
+        levels = self._current_levels(time.time())
+        costs = {"requests": 1, "tokens": tokens}
+        return any(levels[name] < min(costs[name], per_minute) for name, per_minute in self.limits.items())
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Return over-estimated tokens to the bucket (or take the shortfall) once usage is known."""
+        if actual is not None and actual != estimated:
+            self._transact({"tokens": actual - estimated})
+
+
+# Groq quotas are per model, so each model gets its own buckets
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def rate_limiter_for(model: str) -> RateLimiter:
+    with _rate_limiters_lock:
+        if model not in _rate_limiters:
+            _rate_limiters[model] = RateLimiter.from_env(scope=model)
+        return _rate_limiters[model]
+
+
+# ============================================================================
+# HEDGING
+# ============================================================================
+
+class LatencyTracker:
+    """Sliding window of recent completion latencies."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float):
+        """Latency at `pct`, or None until there are enough samples to trust it."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class HedgeBudget:
+    """Each primary request earns `ratio` of a hedge; a hedge is only sent with a whole one saved."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.sent = 0
+        self.won = 0
+        self._credit = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self) -> None:
+        with self._lock:
+            self._credit = min(self.burst, self._credit + self.ratio)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self._credit < 1:
+                return False
+            self._credit -= 1
+            self.sent += 1
+            return True
+
+
+latency_tracker = LatencyTracker()
+hedge_budget = HedgeBudget()
+
+
+# ============================================================================
+# CLIENTS
+# ============================================================================
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_client() -> Groq:
+    """Process-wide sync client with a keep-alive connection pool."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                _client = Groq(
+                    api_key=os.getenv("GROQ_API_KEY"),
+                    http_client=httpx.Client(limits=POOL_LIMITS, timeout=DEFAULT_TIMEOUT),
+                    max_retries=0,  # retries are handled here, with jitter and the breaker
+                )
+            except groq.GroqError as exc:
+                raise classify_error(exc) from exc
+    return _client
+
+
+def get_async_client() -> AsyncGroq:
+    """Process-wide async client; only use it on the loop from `background_loop`."""
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            try:
+                _async_client = AsyncGroq(
+                    api_key=os.getenv("GROQ_API_KEY"),
+                    http_client=httpx.AsyncClient(limits=POOL_LIMITS, timeout=DEFAULT_TIMEOUT),
+                    max_retries=0,
+                )
+            except groq.GroqError as exc:
+                raise classify_error(exc) from exc
+    return _async_client
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    # One long-lived loop per process keeps the async client bound to a single loop
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="study-buddy-llm", daemon=True).start()
+    return _loop
+
+
+def run_async(coro):
+    """Run an agent coroutine to completion from synchronous code (e.g. a Streamlit script)."""
+    return asyncio.run_coroutine_threadsafe(carry_context(coro), background_loop()).result()
+
+
+def warm_up(timeout: float = 5.0) -> bool:
+    """Open pooled connections ahead of the first user request."""
+    try:
+        get_client().models.list(timeout=timeout)
+        run_async(get_async_client().models.list(timeout=timeout))
+    except Exception:
+        return False
+    return True
+
+
+# ============================================================================
+# RESILIENT CALLS
+# ============================================================================
+
+def _settle_usage(limiter: RateLimiter, estimated: int, resp, started: float) -> None:
+    # Streams report no usage up front; their estimate stands
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        limiter.settle(estimated, usage.total_tokens)
+        latency_tracker.record(time.monotonic() - started)
+
+
+def chat_completion(model: str, messages: list, temperature: float, timeout: float = None,
+                    retry_rate_limited: bool = True, timing: dict = None, **kwargs):
+    """`chat.completions.create` with retries, backoff, a per-call timeout and the breaker.
+
+    With ``stream=True`` only opening the stream is retried. Every attempt first
+    waits for a fair-share slot (see `scheduler`), then its turn on the model's
+    rate limiter; the slot is returned while backing off. Callers that can switch
+    to another model pass ``retry_rate_limited=False`` to get 429s straight away.
+    A `timing` dict gets ``"upstream"``: the seconds the answering attempt spent
+    with the provider, without queueing or backoff.
+    """
+    client = get_client()  # raises LLMAuthError without a key, before any quota is spent
+    estimated = estimate_request_tokens(messages, kwargs.get("max_tokens"))
+    limiter = rate_limiter_for(model)
+    for attempt in range(MAX_RETRIES + 1):
+        with scheduler.slot():
+            # An open circuit fails fast, before any quota is reserved or waited for
+            admission = breaker.admit()
+            if admission is None:
+                raise LLMCircuitOpenError("LLM calls paused after repeated failures")
+            try:
+                limiter.acquire(estimated)
+                started = time.monotonic()
+                resp = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=timeout or DEFAULT_TIMEOUT,
+                    **kwargs,
+                )
+            except groq.APIError as exc:
+                failure = exc
+                if _trips_breaker(exc):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if not _is_retryable(exc, retry_rate_limited) or attempt == MAX_RETRIES:
+                    raise classify_error(exc) from exc
+            except BaseException:
+                # Cancelled, queued too long or crashed: no verdict, but the trial must not stay taken
+                if admission == "trial":
+                    breaker.release_trial()
+                raise
+            else:
+                breaker.record_success()
+                _settle_usage(limiter, estimated, resp, started)
+                if timing is not None:
+                    timing["upstream"] = time.monotonic() - started
+                return resp
+        time.sleep(_backoff_delay(attempt, failure))
+
+
+async def async_chat_completion(model: str, messages: list, temperature: float, timeout: float = None,
+                                retry_rate_limited: bool = True, dispatched: asyncio.Event = None,
+                                timing: dict = None, **kwargs):
+    """Async counterpart of `chat_completion`; sets `dispatched` once a request is actually sent."""
+    client = get_async_client()
+    estimated = estimate_request_tokens(messages, kwargs.get("max_tokens"))
+    limiter = rate_limiter_for(model)
+    for attempt in range(MAX_RETRIES + 1):
+        async with scheduler.async_slot():
+            # An open circuit fails fast, before any quota is reserved or waited for
+            admission = breaker.admit()
+            if admission is None:
+                raise LLMCircuitOpenError("LLM calls paused after repeated failures")
+            try:
+                await limiter.acquire_async(estimated)
+                started = time.monotonic()
+                if dispatched is not None:
+                    dispatched.set()
+                resp = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=timeout or DEFAULT_TIMEOUT,
+                    **kwargs,
+                )
+            except groq.APIError as exc:
+                failure = exc
+                if _trips_breaker(exc):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if not _is_retryable(exc, retry_rate_limited) or attempt == MAX_RETRIES:
+                    raise classify_error(exc) from exc
+            except BaseException:
+                # Cancelled, queued too long or crashed: no verdict, but the trial must not stay taken
+                if admission == "trial":
+                    breaker.release_trial()
+                raise
+            else:
+                breaker.record_success()
+                _settle_usage(limiter, estimated, resp, started)
+                if timing is not None:
+                    timing["upstream"] = time.monotonic() - started
+                return resp
+        await asyncio.sleep(_backoff_delay(attempt, failure))
+
+
+async def hedged_chat_completion(model: str, messages: list, temperature: float, timeout: float = None,
+                                 retry_rate_limited: bool = True, **kwargs):
+    """`async_chat_completion` that sends a duplicate when the first is slow, keeping the faster.
+
+    The duplicate goes out once the call has been with the provider longer than
+    `HEDGE_PERCENTILE` of recent latencies, and only while `hedge_budget` allows and
+    the rate limiter has no queue; the loser is cancelled. Streams are never hedged.
+    """
+    hedge_budget.earn()
+    delay = latency_tracker.percentile(HEDGE_PERCENTILE)
+    dispatched = asyncio.Event()
+    primary = asyncio.ensure_future(async_chat_completion(model, messages, temperature, timeout, retry_rate_limited,
+                                                          dispatched=dispatched, **kwargs))
+    attempts = [primary]
+    try:
+        if delay is None or kwargs.get("stream"):
+            return await primary
+
+        # Time spent queued in the scheduler or rate limiter is not provider latency
+        sent = asyncio.ensure_future(dispatched.wait())
+        try:
+            await asyncio.wait([primary, sent], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sent.cancel()
+        if primary.done():
+            return await primary
+
+        done, _ = await asyncio.wait(attempts, timeout=max(delay, HEDGE_MIN_DELAY))
+        # A hedge that has to queue behind the primary cannot win, and only adds load
+        queued = rate_limiter_for(model).would_wait(estimate_request_tokens(messages, kwargs.get("max_tokens")))
+        if done or queued or not hedge_budget.spend():
+            return await primary
+
+        hedge = asyncio.ensure_future(async_chat_completion(model, messages, temperature, timeout, retry_rate_limited, **kwargs))
+        attempts.append(hedge)
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda task: task.exception() is not None):
+                # A failed attempt only decides the outcome if it was the last one running
+                if task.exception() is None or not pending:
+                    if task is hedge and task.exception() is None:
+                        hedge_budget.won += 1
+                    return task.result()
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from llm_client import LLMRateLimitError
+
+FAST_MODEL = os.getenv("STUDY_BUDDY_FAST_MODEL", "llama-3.1-8b-instant")
+LARGE_MODEL = os.getenv("STUDY_BUDDY_LARGE_MODEL", "llama-3.3-70b-versatile")
+
+# Work at or under all of these goes to the fast model first
+FAST_MAX_INPUT_TOKENS = 600
+FAST_LEVELS = ("Beginner", "Intermediate")
+FAST_DIFFICULTIES = ("Easy", "Medium")
+FAST_MAX_QUESTIONS = 5
+
+# A model slower than this on average hands its work to a clearly faster one
+LATENCY_SLO_SECONDS = float(os.getenv("STUDY_BUDDY_LATENCY_SLO", 10))
+MAX_ERROR_RATE = 0.5
+RATE_LIMIT_COOLDOWN_SECONDS = 30.0
+EWMA_ALPHA = 0.2
+
+
+@dataclass(slots=True)
+class ModelHealth:
+    latency: float = None  # EWMA of successful call latency, seconds
+    error_rate: float = 0.0  # EWMA of failures
+    rate_limited_until: float = 0.0
+    calls: int = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.rate_limited_until and self.error_rate <= MAX_ERROR_RATE
+
+
+class Route(tuple):
+    """Models to try, in order, plus `preferred`: the one the work's size and difficulty call for.
+
+    The order follows the models' health; `preferred` does not, so it is what caches key on.
+    """
+
+    def __new__(cls, models, preferred: str):
+        route = super().__new__(cls, models)
+        route.preferred = preferred
+        return route
+
+
+class ModelRouter:
+    """Picks a model per call from the work's size and difficulty and each model's recent health."""
+
+    def __init__(self, fast_model: str = FAST_MODEL, large_model: str = LARGE_MODEL):
+        self.fast_model = fast_model
+        self.large_model = large_model
+        self._health = {fast_model: ModelHealth(), large_model: ModelHealth()}
+        self._lock = threading.Lock()
+
+    def is_simple(self, input_tokens: int, level: str = None, difficulty: str = None,
+                  num_questions: int = None) -> bool:
+        return (
+            input_tokens <= FAST_MAX_INPUT_TOKENS
+            and (level is None or level in FAST_LEVELS)
+            and (difficulty is None or difficulty in FAST_DIFFICULTIES)
+            and (num_questions is None or num_questions <= FAST_MAX_QUESTIONS)
+        )
+
+    def route(self, input_tokens: int, level: str = None, difficulty: str = None,
+              num_questions: int = None) -> Route:
+        """Models to try, in order; later ones are failovers for rate limits."""
+        if self.is_simple(input_tokens, level, difficulty, num_questions):
+            preferred, other = self.fast_model, self.large_model
+        else:
+            preferred, other = self.large_model, self.fast_model
+        routed = preferred
+
+        now = time.monotonic()
+        with self._lock:
+            first, second = self._health[preferred], self._health[other]
+            if not first.healthy(now) and second.healthy(now):
+                preferred, other = other, preferred
+            elif (first.latency is not None and first.latency > LATENCY_SLO_SECONDS
+                  and second.healthy(now) and second.latency is not None and second.latency < first.latency / 2):
+                preferred, other = other, preferred
+        return Route((preferred, other), routed)
+
+    def record(self, model: str, seconds: float = None, error: Exception = None) -> None:
+        """Feed back the outcome of one call to `model`."""
+        with self._lock:
+            health = self._health.setdefault(model, ModelHealth())
+            health.calls += 1
+            if error is not None:
+                health.error_rate += EWMA_ALPHA * (1 - health.error_rate)
+                if isinstance(error, LLMRateLimitError):
+                    health.rate_limited_until = time.monotonic() + RATE_LIMIT_COOLDOWN_SECONDS
+                return
+            health.error_rate -= EWMA_ALPHA * health.error_rate
+            if seconds is not None:
+                health.latency = seconds if health.latency is None else (
+                    health.latency + EWMA_ALPHA * (seconds - health.latency)
+                )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                model: {"latency": h.latency, "error_rate": h.error_rate, "calls": h.calls}
+                for model, h in self._health.items()
+            }
+
+
+router = ModelRouter()
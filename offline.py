@@ -0,0 +1,279 @@
+import math
+import os
+import random
+import re
+import zlib
+from collections import Counter
+
+from quiz_model import LETTERS, QUIZ_DIFFICULTIES, Question, Quiz
+from text_processing import clean_text
+
+# Set to skip the LLM entirely, e.g. on a laptop with no network in class
+OFFLINE_MODE = os.getenv("STUDY_BUDDY_OFFLINE", "0").lower() in ("1", "true", "yes")
+
+OFFLINE_NOTE = "📴 *Offline summary: picked from your text because the AI service was unavailable.*"
+
+# Sentences in the explanation, by level; key points are always 3-5
+SUMMARY_SENTENCES = {"Beginner": 3, "Intermediate": 4, "Advanced": 5, "Expert": 5}
+DEFAULT_SUMMARY_SENTENCES = 4
+MAX_KEY_POINT_WORDS = 20
+# Ranking is quadratic in sentences; longer texts are sampled evenly to stay in milliseconds
+MAX_SENTENCES = 150
+
+DAMPING = 0.85
+ITERATIONS = 30
+
+# Cloze quizzes: candidate answers are words (and repeated two-word phrases) of at least this many letters
+MIN_TERM_CHARS = 4
+MAX_QUESTION_WORDS = 45
+BLANK = "_____"
+# Difficulties that get look-alike distractors and blank the rarer terms
+HARD_DIFFICULTIES = QUIZ_DIFFICULTIES[QUIZ_DIFFICULTIES.index("Hard"):]
+
+_SENTENCE = re.compile(r"[^.!?\n]+(?:[.!?]+|$)")
+_WORD = re.compile(r"[a-z][a-z0-9'-]+")
+_CLAUSE_BREAK = re.compile(r"[;:]\s|\s[—–]\s")
+_TERM = re.compile(r"[A-Za-z][A-Za-z0-9'-]*[A-Za-z0-9]")
+_DEFINITION = re.compile(rf"^(?:an?\s+|the\s+)?{BLANK}\s+(?:is|are|was|were|refers to|means)\b", re.I)
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have having
+he her here hers him his how i if in into is it its itself just like may me might more most must my no nor
+not now of off on once only or other our ours out over own same she should so some such than that the their
+theirs them then there these they this those through to too under until up very was we were what when where
+which while who whom why will with would you your yours
+""".split())
+
+# Frequent words that make poor quiz answers even though they carry some meaning
+NON_TERMS = STOPWORDS | frozenset("""
+across also although among another around called can't during either else even every first however
+include included includes including known less made make makes making many much often perhaps rather
+second several since still take taken takes than then therefore third though thus toward towards upon
+use used uses using usually well whether within without
+""".split())
+
+
+def split_sentences(text: str) -> list:
+    sentences = (match.group().strip() for match in _SENTENCE.finditer(text))
+    return [s for s in sentences if len(_WORD.findall(s.lower())) >= 3]
+
+
+def _terms(sentence: str) -> list:
+    return [word for word in _WORD.findall(sentence.lower()) if word not in STOPWORDS]
+
+
+def _tfidf_vectors(sentences: list) -> list:
+    term_lists = [_terms(sentence) for sentence in sentences]
+    document_frequency = Counter(term for terms in term_lists for term in set(terms))
+    n = len(sentences)
+    vectors = []
+    for terms in term_lists:
+        counts = Counter(terms)
+        vector = {term: (count / len(terms)) * math.log((1 + n) / (1 + document_frequency[term])) + 1e-9
+                  for term, count in counts.items()} if terms else {}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vectors.append({term: weight / norm for term, weight in vector.items()})
+    return vectors
+
+
+def rank_sentences(sentences: list) -> list:
+    """TextRank over TF-IDF cosine similarity; returns one score per sentence."""
+    n = len(sentences)
+    if n <= 2:
+        return [1.0] * n
+    vectors = _tfidf_vectors(sentences)
+    weights = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            small, large = sorted((vectors[i], vectors[j]), key=len)
+            similarity = sum(weight * large.get(term, 0.0) for term, weight in small.items())
+            weights[i][j] = weights[j][i] = similarity
+    out_weight = [sum(row) or 1.0 for row in weights]
+    # Incoming edges only, pre-normalised, so each iteration skips unrelated pairs
+    incoming = [
+        [(j, weights[j][i] / out_weight[j]) for j in range(n) if weights[j][i]]
+        for i in range(n)
+    ]
+
+    scores = [1.0 / n] * n
+    for _ in range(ITERATIONS):
+        scores = [
+            (1 - DAMPING) / n + DAMPING * sum(weight * scores[j] for j, weight in edges)
+            for edges in incoming
+        ]
+    # Lead sentences usually introduce the topic; nudge ties toward them
+    return [score * (1 + 0.1 / (1 + index)) for index, score in enumerate(scores)]
+
+
+def _key_point(sentence: str) -> str:
+    clause = _CLAUSE_BREAK.split(sentence)[0].strip().rstrip(".!?")
+    words = clause.split()
+    if len(words) > MAX_KEY_POINT_WORDS:
+        clause = " ".join(words[:MAX_KEY_POINT_WORDS]) + "…"
+    return clause
+
+
+def summarize(text: str, level: str = None) -> dict:
+    """Explanation sentences (in reading order) and 3-5 key points, picked from `text` locally."""
+    sentences = split_sentences(clean_text(text).text)
+    if len(sentences) > MAX_SENTENCES:
+        step = len(sentences) / MAX_SENTENCES
+        sentences = [sentences[int(i * step)] for i in range(MAX_SENTENCES)]
+    if not sentences:
+        return {"sentences": [], "key_points": []}
+    scores = rank_sentences(sentences)
+    ranked = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+
+    count = SUMMARY_SENTENCES.get(level, DEFAULT_SUMMARY_SENTENCES)
+    chosen = sorted(ranked[:count])
+    key_points, seen = [], set()
+    for index in ranked:
+        point = _key_point(sentences[index])
+        if point.lower() not in seen:
+            seen.add(point.lower())
+            key_points.append(point)
+        if len(key_points) == 5:
+            break
+    return {"sentences": [sentences[i] for i in chosen], "key_points": key_points}
+
+
+def offline_explanation(text: str, level: str = None, note: str = OFFLINE_NOTE) -> str:
+    """Explanation text in the explainer agent's shape, built without the network."""
+    summary = summarize(text, level)
+    parts = [note] if note else []
+    parts.append(" ".join(summary["sentences"]) or clean_text(text).text[:600])
+    if summary["key_points"]:
+        parts.append("Key points:\n" + "\n".join(
+            f"{i}. {point}" for i, point in enumerate(summary["key_points"], 1)
+        ))
+    return "\n\n".join(parts)
+
+
+def _term_key(term: str) -> str:
+    return term.lower()
+
+
+def extract_terms(sentences: list) -> tuple:
+    """Key terms of the passage as {key: (display form, sentences containing it)}, and each sentence's keys."""
+    forms, sentence_count, sentence_terms = {}, Counter(), []
+    for sentence in sentences:
+        words = _TERM.findall(sentence)
+        found = {}  # ordered, so the same text always yields the same quiz
+        for i, word in enumerate(words):
+            lower = word.lower()
+            if lower in NON_TERMS or len(lower) < MIN_TERM_CHARS or lower.endswith("ly"):
+                continue
+            found[lower] = None
+            forms.setdefault(lower, Counter())[word] += 1
+            if i + 1 < len(words):
+                following = words[i + 1]
+                if following.lower() not in NON_TERMS and len(following) >= MIN_TERM_CHARS:
+                    phrase = f"{word} {following}"
+                    found[phrase.lower()] = None
+                    forms.setdefault(phrase.lower(), Counter())[phrase] += 1
+        sentence_count.update(found.keys())
+        sentence_terms.append(found)
+
+    terms = {}
+    for key, count in sentence_count.items():
+        # A phrase is only a term if the passage repeats it; single words always qualify
+        if " " in key and count < 2:
+            continue
+        # Prefer the lowercase spelling unless the term is always capitalised (a name)
+        form = key if key in forms[key] else forms[key].most_common(1)[0][0]
+        terms[key] = (form, count)
+    return terms, [[key for key in found if key in terms] for found in sentence_terms]
+
+
+def _distractors(answer: str, terms: dict, sentence: str, difficulty: str, rng: random.Random) -> list:
+    sentence_lower = sentence.lower()
+    candidates = [
+        form for key, (form, _) in terms.items()
+        if key != answer and key not in sentence_lower and answer not in key and key not in answer
+    ]
+    answer_words = answer.count(" ") + 1
+    if difficulty == "Easy":
+        rng.shuffle(candidates)
+    else:
+        # Harder quizzes pick look-alikes: same word count, similar length, same ending
+        def closeness(form: str) -> tuple:
+            return (
+                form.count(" ") + 1 != answer_words,
+                difficulty in HARD_DIFFICULTIES and form.lower()[-3:] != answer[-3:],
+                abs(len(form) - len(answer)),
+                rng.random(),
+            )
+        candidates.sort(key=closeness)
+    chosen = []
+    for form in candidates:
+        # "chemical" next to "chemical energy" gives the answer away or makes two options right
+        if not any(form.lower() in other.lower() or other.lower() in form.lower() for other in chosen):
+            chosen.append(form)
+        if len(chosen) == len(LETTERS) - 1:
+            break
+    return chosen
+
+
+def _cloze_question(sentence: str, answer: str, form: str, terms: dict, difficulty: str,
+                    rng: random.Random):
+    pattern = re.compile(rf"\b{re.escape(answer)}\b", re.I)
+    if not pattern.search(sentence):
+        return None
+    distractors = _distractors(answer, terms, sentence, difficulty, rng)
+    if not distractors:
+        return None
+    blanked = pattern.sub(BLANK, sentence, count=1)
+    words = blanked.split()
+    if len(words) > MAX_QUESTION_WORDS:
+        blanked = " ".join(words[:MAX_QUESTION_WORDS]) + " …"
+    if _DEFINITION.match(blanked):
+        question = f"Which term is being defined here? “{blanked}”"
+    else:
+        question = f"Fill in the blank: {blanked}"
+
+    options = distractors + [form]
+    rng.shuffle(options)
+    return Question(question=question, options=tuple(options), answer=LETTERS[options.index(form)])
+
+
+def offline_quiz(text: str, difficulty: str = "Medium", num_questions: int = 5) -> Quiz:
+    """Multiple-choice cloze questions built locally from `text`, for when the quiz agent cannot run."""
+    text = clean_text(text.replace(OFFLINE_NOTE, "")).text
+    sentences = split_sentences(text)
+    if len(sentences) > MAX_SENTENCES:
+        step = len(sentences) / MAX_SENTENCES
+        sentences = [sentences[int(i * step)] for i in range(MAX_SENTENCES)]
+    # Drop repeats and prefixes of other sentences, such as an explanation's own key points
+    keys = [sentence.lower().rstrip(".!?… ") for sentence in sentences]
+    sentences = [
+        sentence for i, sentence in enumerate(sentences)
+        if keys[i] not in keys[:i] and not any(len(other) > len(keys[i]) and other.startswith(keys[i]) for other in keys)
+    ]
+    if not sentences:
+        return Quiz(difficulty=difficulty, offline=True)
+
+    terms, sentence_terms = extract_terms(sentences)
+    scores = rank_sentences(sentences)
+    order = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+    # Easy quizzes blank the passage's central terms, hard ones its less repeated details
+    prefer_rare = difficulty in HARD_DIFFICULTIES
+    # Same text, same quiz: cache hits and retries stay consistent
+    rng = random.Random(zlib.crc32(f"{difficulty}\n{text}".encode()))
+
+    questions, used = [], set()
+    for index in order:
+        sentence = sentences[index]
+        candidates = sorted(
+            (key for key in sentence_terms[index] if key not in used),
+            key=lambda key: (terms[key][1] if prefer_rare else -terms[key][1], -len(key), key),
+        )
+        for key in candidates:
+            question = _cloze_question(sentence, key, terms[key][0], terms, difficulty, rng)
+            if question is not None:
+                questions.append(question)
+                used.add(key)
+                break
+        if len(questions) == num_questions:
+            break
+    return Quiz(questions=questions, difficulty=difficulty, offline=True)
@@ -1,26 +1,7 @@
-import re
 import streamlit as st
 from datetime import datetime
 
 
-def format_quiz_as_points(quiz_text: str) -> str:
-    if not quiz_text:
-        return ""
-    out_lines = []
-    for line in quiz_text.splitlines():
-        s = line.strip()
-        if not s:
-            continue
-        if re.match(r'^(?:\d+[\.)]|Question[:\s]|Q[:\s])', s, re.I):
-            cleaned = re.sub(r'^(?:\d+[\.)]\s*|Question[:\s]*|Q[:\s]*)', '', s, flags=re.I)
-            out_lines.append(f"- {cleaned}")
-        elif re.match(r'^[A-D][\.|\)]', s, re.I):
-            out_lines.append(f"    - {s}")
-        else:
-            out_lines.append(f"- {s}")
-    return "\n".join(out_lines)
-
-
 st.title("📚 Results — AI Study Buddy")
 
 last_exp = st.session_state.get('last_explanation', '')
@@ -34,7 +15,7 @@ else:
 
     st.divider()
     st.markdown(f"#### 🧠 Quiz ({st.session_state.get('difficulty','N/A')} Level)")
-    formatted = format_quiz_as_points(last_quiz)
+    formatted = last_quiz.to_markdown(compact=True) if last_quiz else ""
     if formatted:
         st.markdown(formatted)
     else:
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import threading
+
+from artifacts import ArtifactStore, text_key
+from llm_client import LLMError, background_loop, rate_limiter_for
+from model_router import router
+from quiz_model import QUIZ_DIFFICULTIES
+from scheduler import BATCH, carry_context, llm_context
+from study_buddy import async_quiz_agent
+from text_processing import estimate_tokens
+
+# Prefetching only spends quota while at least this share of the model's minute budget is unused
+MIN_HEADROOM = float(os.getenv("STUDY_BUDDY_PREFETCH_HEADROOM", 0.5))
+
+
+class Prefetcher:
+    """Writes a user's quiz at the other difficulty levels ahead of time, into the artifact store.
+
+    One prefetch per user at a time, sent at batch priority and only while the
+    rate limiter has headroom; moving to new text cancels it, in-flight call included.
+    """
+
+    def __init__(self, artifacts: ArtifactStore, difficulties: tuple = QUIZ_DIFFICULTIES):
+        self.artifacts = artifacts
+        self.difficulties = difficulties
+        self.prefetched = 0
+        self._tasks = {}  # user_id -> (text key, level, concurrent future)
+        self._lock = threading.Lock()
+
+    def start(self, user_id: str, text: str, level: str, explanation: str, num_questions: int,
+              skip: tuple = ()) -> None:
+        """Prefetch quizzes on `explanation` at every difficulty but those in `skip`."""
+        key = text_key(text)
+        with self._lock:
+            current = self._tasks.get(user_id)
+            if current is not None and current[:2] == (key, level) and not current[2].done():
+                return
+            if current is not None:
+                current[2].cancel()
+            with llm_context(user_id, BATCH):
+                coro = carry_context(self._prefetch(key, level, explanation, num_questions, skip))
+            self._tasks[user_id] = (key, level, asyncio.run_coroutine_threadsafe(coro, background_loop()))
+
+    def cancel(self, user_id: str) -> None:
+        with self._lock:
+            current = self._tasks.pop(user_id, None)
+        if current is not None:
+            current[2].cancel()
+
+    def follow_text(self, user_id: str, text: str) -> None:
+        """Cancel the user's prefetch if `text` is no longer the text it is for."""
+        with self._lock:
+            current = self._tasks.get(user_id)
+        if current is not None and (current[2].done() or current[0] != text_key(text)):
+            self.cancel(user_id)
+
+    def active(self, user_id: str) -> bool:
+        with self._lock:
+            current = self._tasks.get(user_id)
+        return current is not None and not current[2].done()
+
+    async def _prefetch(self, key: str, level: str, explanation: str, num_questions: int, skip: tuple) -> None:
+        for difficulty in self.difficulties:
+            if difficulty in skip:
+                continue
+            stored = self.artifacts.quiz(key, level, difficulty, num_questions)
+            if stored is not None and len(stored) >= num_questions:
+                continue
+            model = router.route(estimate_tokens(explanation), difficulty=difficulty,
+                                 num_questions=num_questions)[0]
+            if rate_limiter_for(model).headroom() < MIN_HEADROOM:
+                return  # leave the rest of the minute's quota to requests someone is waiting on
+            try:
+                quiz = await async_quiz_agent(explanation, difficulty=difficulty, num_questions=num_questions,
+                                              existing=stored)
+            except LLMError:
+                return
+            if quiz.offline:
+                return  # the provider is struggling; local quizzes are made on demand anyway
+            self.artifacts.put_quiz(key, level, quiz)
+            self.prefetched += 1
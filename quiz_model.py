@@ -0,0 +1,193 @@
+import json
+import re
+from dataclasses import dataclass, field
+
+LETTERS = "ABCD"
+
+# The sidebar's "Explanation Depth" and "Quiz Challenge Level" choices, easiest first
+EXPLANATION_LEVELS = ("Beginner", "Intermediate", "Advanced", "Expert")
+QUIZ_DIFFICULTIES = ("Easy", "Medium", "Hard", "Expert", "Master")
+
+# Shape requested from the quiz agent (JSON mode)
+QUIZ_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "options": {"type": "array", "items": {"type": "string"}, "minItems": 4, "maxItems": 4},
+                    "answer": {"type": "string", "enum": list(LETTERS)},
+                },
+                "required": ["question", "options", "answer"],
+            },
+        },
+    },
+    "required": ["questions"],
+}
+
+_OPTION_PREFIX = re.compile(r"^\(?([A-D])[\.\):]\s*", re.I)
+_QUESTION_LINE = re.compile(r"^(?:\d+[\.)]|Question[:\s]|Q[:\s])", re.I)
+_QUESTION_PREFIX = re.compile(r"^(?:\d+[\.)]\s*|Question\s*\d*[:\.]?\s*|Q\d*[:\.]?\s*)", re.I)
+_ANSWER_LINE = re.compile(r"^(?:correct\s+)?answer(?:\s+letter)?\s*[:\-]\s*\(?([A-D])\b", re.I)
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+# Questions sharing this much of their wording (Jaccard over words) count as the same question
+DUPLICATE_SIMILARITY = 0.8
+
+
+def _answer_letter(value, options: tuple) -> str:
+    """Normalise "B", "b)", "Answer: B" or the option text itself to a letter."""
+    value = str(value).strip()
+    letter = re.match(r"^\(?([A-Da-d])(?:[\.\):]|$)", value)
+    if letter:
+        return letter.group(1).upper()
+    stripped = _OPTION_PREFIX.sub("", value).strip().lower()
+    for i, option in enumerate(options[:len(LETTERS)]):
+        if option.lower() == stripped:
+            return LETTERS[i]
+    letter = re.search(r"\b([A-D])\b", value)
+    return letter.group(1) if letter else ""
+
+
+@dataclass(slots=True)
+class Question:
+    question: str
+    options: tuple
+    answer: str
+
+    @property
+    def answer_text(self) -> str:
+        index = LETTERS.find(self.answer)
+        return self.options[index] if 0 <= index < len(self.options) else ""
+
+    def is_correct(self, letter: str) -> bool:
+        return letter.strip().upper()[:1] == self.answer
+
+    def words(self) -> frozenset:
+        return frozenset(_NON_WORD.split(self.question.lower())) - {""}
+
+    def duplicates(self, other: "Question") -> bool:
+        """Same question, give or take rewording, punctuation and case."""
+        mine, theirs = self.words(), other.words()
+        if not mine or not theirs:
+            return mine == theirs
+        return len(mine & theirs) / len(mine | theirs) >= DUPLICATE_SIMILARITY
+
+    def to_dict(self) -> dict:
+        return {"question": self.question, "options": list(self.options), "answer": self.answer}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Build a question from agent output, or return None if it is unusable."""
+        question = str(data.get("question", "")).strip()
+        options = tuple(_OPTION_PREFIX.sub("", str(o)).strip() for o in data.get("options") or [])
+        answer = _answer_letter(data.get("answer", ""), options)
+        if not question or len(options) < 2 or answer not in LETTERS[:len(options)]:
+            return None
+        return cls(question=question, options=options[:len(LETTERS)], answer=answer)
+
+
+@dataclass(slots=True)
+class Quiz:
+    questions: list = field(default_factory=list)
+    difficulty: str = ""
+    offline: bool = False  # built locally from the text rather than by the quiz agent
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def extended(self, other: "Quiz", limit: int = None) -> "Quiz":
+        """A new quiz: these questions, then those of `other` that do not repeat one, up to `limit`."""
+        questions = list(self.questions)
+        for question in other:
+            if limit is not None and len(questions) >= limit:
+                break
+            if not any(question.duplicates(kept) for kept in questions):
+                questions.append(question)
+        return Quiz(questions=questions[:limit], difficulty=self.difficulty or other.difficulty,
+                    offline=self.offline or other.offline)
+
+    def score(self, responses: dict) -> int:
+        """Count correct answers in `responses`, a mapping of question index to chosen letter."""
+        return sum(
+            1 for i, letter in responses.items()
+            if 0 <= i < len(self.questions) and self.questions[i].is_correct(letter)
+        )
+
+    def to_dict(self) -> dict:
+        data = {"difficulty": self.difficulty, "questions": [q.to_dict() for q in self.questions]}
+        if self.offline:
+            data["offline"] = True
+        return data
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    @classmethod
+    def from_dict(cls, data: dict, difficulty: str = ""):
+        questions = [q for q in (Question.from_dict(item) for item in data.get("questions") or []
+                                 if isinstance(item, dict)) if q is not None]
+        return cls(questions=questions, difficulty=data.get("difficulty") or difficulty,
+                   offline=bool(data.get("offline")))
+
+    def to_markdown(self, compact: bool = False, show_answers: bool = True) -> str:
+        """Render for st.markdown; `compact` gives a nested bullet list instead of headings."""
+        out_lines = []
+        for number, q in enumerate(self.questions, 1):
+            if compact:
+                out_lines.append(f"- {number}. {q.question}")
+                out_lines.extend(f"    - {letter}) {option}" for letter, option in zip(LETTERS, q.options))
+                if show_answers:
+                    out_lines.append(f"    - ✅ Answer: {q.answer}")
+            else:
+                out_lines.append(f"### {number}. {q.question}")
+                out_lines.extend(f"• **{letter})** {option}" for letter, option in zip(LETTERS, q.options))
+                if show_answers:
+                    out_lines.append(f"\n✅ **Answer:** {q.answer}) {q.answer_text}")
+            out_lines.append("")
+        return "\n".join(out_lines).strip()
+
+
+def _parse_legacy_text(raw: str) -> list:
+    """Best-effort parse of the old free-text quiz format."""
+    questions = []
+    current = None
+    for line in raw.splitlines():
+        s = line.strip().lstrip("-*• ").strip()
+        if not s:
+            continue
+        answer = _ANSWER_LINE.match(s)
+        if answer and current is not None:
+            current["answer"] = answer.group(1)
+        elif _OPTION_PREFIX.match(s) and current is not None:
+            current["options"].append(s)
+        elif _QUESTION_LINE.match(s):
+            current = {"question": _QUESTION_PREFIX.sub("", s), "options": [], "answer": ""}
+            questions.append(current)
+    return questions
+
+
+def parse_quiz(raw, difficulty: str = "") -> Quiz:
+    """Parse quiz agent output (JSON, or legacy free text) into a `Quiz`, once."""
+    if isinstance(raw, Quiz):
+        return raw
+    if isinstance(raw, dict):
+        return Quiz.from_dict(raw, difficulty)
+    text = (raw or "").strip()
+    # Tolerate a ```json fenced block around the payload
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = {"questions": _parse_legacy_text(text)}
+    if isinstance(data, list):
+        data = {"questions": data}
+    if not isinstance(data, dict):
+        data = {}
+    return Quiz.from_dict(data, difficulty)
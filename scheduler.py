@@ -0,0 +1,188 @@
+import asyncio
+import contextlib
+import os
+import threading
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)  # served strictly in this order
+
+MAX_IN_FLIGHT = int(os.getenv("STUDY_BUDDY_LLM_CONCURRENCY", 8))
+
+# Who the current LLM call is for; set by whoever starts the work (job worker, batch run, ...)
+current_user = ContextVar("llm_user", default="anonymous")
+current_priority = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def llm_context(user: str, priority: str = INTERACTIVE):
+    """Attribute LLM calls made inside the block to `user` at `priority`."""
+    user_token = current_user.set(user)
+    priority_token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(priority_token)
+        current_user.reset(user_token)
+
+
+def carry_context(coro):
+    """Wrap `coro` so it keeps the caller's user and priority when run on the background loop."""
+    user, priority = current_user.get(), current_priority.get()
+
+    async def run():
+        with llm_context(user, priority):
+            return await coro
+
+    return run()
+
+
+@dataclass(slots=True, eq=False)
+class _Ticket:
+    user: str
+    priority: str
+    event: threading.Event = None
+    future: asyncio.Future = None
+    granted: bool = False
+
+
+class FairScheduler:
+    """Hands out a fixed number of in-flight LLM call slots fairly.
+
+    Interactive calls always go before batch calls. Within a priority, users
+    with waiting calls are served weighted round-robin, so one user's burst
+    queues behind their own earlier calls rather than in front of everyone else.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._weights = {}
+        self._queues = {priority: {} for priority in PRIORITIES}  # priority -> user -> deque of tickets
+        self._rings = {priority: deque() for priority in PRIORITIES}  # users with waiting calls, in turn order
+        self._credits = {}  # (priority, user) -> grants left in the user's current turn
+        self._lock = threading.Lock()
+
+    def set_weight(self, user: str, weight: int) -> None:
+        """Let `user` take `weight` calls per round instead of one."""
+        with self._lock:
+            self._weights[user] = max(1, int(weight))
+
+    def depth(self) -> dict:
+        """Calls waiting for a slot, per priority."""
+        with self._lock:
+            return {
+                priority: sum(len(queue) for queue in self._queues[priority].values())
+                for priority in PRIORITIES
+            }
+
+    def depth_for(self, user: str) -> int:
+        with self._lock:
+            return sum(len(self._queues[priority].get(user, ())) for priority in PRIORITIES)
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        queues = self._queues[ticket.priority]
+        if ticket.user not in queues:
+            queues[ticket.user] = deque()
+            self._rings[ticket.priority].append(ticket.user)
+        queues[ticket.user].append(ticket)
+
+    def _next_ticket(self):
+        for priority in PRIORITIES:
+            ring, queues = self._rings[priority], self._queues[priority]
+            if not ring:
+                continue
+            user = ring[0]
+            key = (priority, user)
+            ticket = queues[user].popleft()
+            credits = self._credits.get(key, self._weights.get(user, 1)) - 1
+            if not queues[user]:
+                ring.popleft()
+                del queues[user]
+                self._credits.pop(key, None)
+            elif credits <= 0:
+                ring.rotate(-1)
+                self._credits.pop(key, None)
+            else:
+                self._credits[key] = credits
+            return ticket
+        return None
+
+    def _dispatch(self) -> None:
+        # Called with the lock held
+        while self.in_flight < self.max_in_flight:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self.in_flight += 1
+            ticket.granted = True
+            if ticket.event is not None:
+                ticket.event.set()
+            else:
+                ticket.future.get_loop().call_soon_threadsafe(_resolve, ticket.future)
+
+    def _withdraw(self, ticket: _Ticket) -> None:
+        """Give up a ticket whose waiter went away, returning its slot if it had one."""
+        with self._lock:
+            if ticket.granted:
+                self.in_flight -= 1
+            else:
+                queue = self._queues[ticket.priority].get(ticket.user)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[ticket.priority][ticket.user]
+                        self._rings[ticket.priority].remove(ticket.user)
+                        self._credits.pop((ticket.priority, ticket.user), None)
+            self._dispatch()
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._dispatch()
+
+    def acquire(self) -> None:
+        """Block until the current user's call may go out."""
+        ticket = _Ticket(current_user.get(), current_priority.get(), event=threading.Event())
+        with self._lock:
+            self._enqueue(ticket)
+            self._dispatch()
+        ticket.event.wait()
+
+    async def acquire_async(self) -> None:
+        ticket = _Ticket(current_user.get(), current_priority.get(), future=asyncio.get_running_loop().create_future())
+        with self._lock:
+            self._enqueue(ticket)
+            self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            self._withdraw(ticket)
+            raise
+
+    @contextlib.contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def async_slot(self):
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+scheduler = FairScheduler()
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import re
+
+ASSETS_DIR = "assets"
+THEME_PATH = os.path.join(ASSETS_DIR, "theme.css")
+ROBO_PATH = os.path.join(ASSETS_DIR, "robo.jpg")
+
+# Served by Streamlit at app/static/ (server.enableStaticServing in .streamlit/config.toml)
+STATIC_DIR = "static"
+STATIC_URL = "app/static"
+
+
+def _draw_placeholder_robot(path: str) -> None:
+    # Only needed on a fresh checkout without assets/robo.jpg
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (160, 160), color=(245, 245, 245))
+    d = ImageDraw.Draw(img)
+    d.rounded_rectangle([20, 20, 140, 120], radius=16, fill=(200, 200, 200), outline=(120, 120, 120))
+    d.ellipse([42, 42, 68, 68], fill=(30, 30, 30))
+    d.ellipse([92, 42, 118, 68], fill=(30, 30, 30))
+    d.rectangle([60, 82, 100, 96], fill=(30, 30, 30))
+    d.line((80, 20, 80, 6), fill=(120, 120, 120), width=4)
+    d.ellipse([76, 0, 84, 8], fill=(220, 0, 0))
+    img.save(path, format="JPEG")
+
+
+def _publish(source_path: str) -> str:
+    """Copy `source_path` into the static dir under a content-hashed name; return its URL."""
+    with open(source_path, "rb") as f:
+        data = f.read()
+    stem, ext = os.path.splitext(os.path.basename(source_path))
+    name = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+    target = os.path.join(STATIC_DIR, name)
+
+    if not os.path.exists(target):
+        tmp_path = target + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, target)
+
+        # Drop builds of this asset that the new hash supersedes
+        stale = re.compile(rf"^{re.escape(stem)}\.[0-9a-f]{{12}}{re.escape(ext)}$")
+        for old in os.listdir(STATIC_DIR):
+            if old != name and stale.match(old):
+                os.remove(os.path.join(STATIC_DIR, old))
+
+    return f"{STATIC_URL}/{name}"
+
+
+def build_static_assets() -> dict:
+    """Publish the robot avatar and read the theme stylesheet; returns the avatar URL and the CSS."""
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    if not os.path.exists(ROBO_PATH):
+        os.makedirs(ASSETS_DIR, exist_ok=True)
+        _draw_placeholder_robot(ROBO_PATH)
+    # Streamlit's static route sends .css as text/plain with nosniff, so browsers would not apply
+    # a <link>ed stylesheet; the theme is inlined by the app instead
+    with open(THEME_PATH, encoding="utf-8") as f:
+        theme_css = f.read()
+    return {
+        "theme_css": theme_css,
+        "robot": _publish(ROBO_PATH),
+    }
+
+
+if __name__ == "__main__":
+    assets = build_static_assets()
+    print(f"robot: {assets['robot']}")
+    print(f"theme_css: {len(assets['theme_css'])} characters (inlined)")
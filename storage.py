@@ -0,0 +1,294 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from quiz_model import parse_quiz
+
+DEFAULT_DB_PATH = os.path.join("data", "study_buddy.sqlite3")
+
+PREVIEW_CHARS = 400
+
+# Columns needed to list sessions without pulling full texts into memory
+_SUMMARY_COLUMNS = (
+    "id, timestamp, date, level, difficulty, mode, char_count, "
+    f"substr(text, 1, {PREVIEW_CHARS}) AS preview, explanation"
+)
+
+
+def _row_to_session(row: sqlite3.Row) -> dict:
+    session = dict(row)
+    session['date'] = date.fromisoformat(session['date'])
+    if 'quiz' in session:
+        session['quiz'] = parse_quiz(session['quiz'] or "", session['difficulty'])
+    return session
+
+
+@dataclass(slots=True)
+class HistoryStats:
+    sessions: int = 0
+    chars: int = 0
+    streak: int = 0
+    streak_end: date = None
+
+
+class HistoryStore:
+    """Study sessions persisted in SQLite, shared by every Streamlit session in the process."""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                date TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                level TEXT,
+                difficulty TEXT,
+                mode TEXT,
+                char_count INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                explanation TEXT,
+                quiz TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id, id);
+            CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions(user_id, date);
+            CREATE INDEX IF NOT EXISTS idx_sessions_difficulty ON sessions(user_id, difficulty);
+            CREATE INDEX IF NOT EXISTS idx_sessions_mode ON sessions(user_id, mode);
+
+            -- Aggregates kept up to date by add()/delete() so the UI never rescans sessions
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id TEXT PRIMARY KEY,
+                sessions INTEGER NOT NULL,
+                chars INTEGER NOT NULL,
+                streak INTEGER NOT NULL,
+                streak_end TEXT
+            );
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                user_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                sessions INTEGER NOT NULL,
+                PRIMARY KEY (user_id, date)
+            );
+            CREATE TABLE IF NOT EXISTS difficulty_stats (
+                user_id TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                sessions INTEGER NOT NULL,
+                PRIMARY KEY (user_id, difficulty)
+            );
+            """
+        )
+        self._conn.commit()
+        self._backfill_aggregates()
+
+    def _backfill_aggregates(self) -> None:
+        """Build aggregates for databases written before they existed."""
+        with self._lock:
+            missing = self._conn.execute(
+                "SELECT DISTINCT user_id FROM sessions WHERE user_id NOT IN (SELECT user_id FROM user_stats)"
+            ).fetchall()
+            for (user_id,) in missing:
+                self._conn.execute(
+                    "INSERT INTO daily_stats (user_id, date, sessions) "
+                    "SELECT user_id, date, COUNT(*) FROM sessions WHERE user_id = ? GROUP BY date",
+                    (user_id,),
+                )
+                self._conn.execute(
+                    "INSERT INTO difficulty_stats (user_id, difficulty, sessions) "
+                    "SELECT user_id, COALESCE(difficulty, 'Unknown'), COUNT(*) FROM sessions "
+                    "WHERE user_id = ? GROUP BY COALESCE(difficulty, 'Unknown')",
+                    (user_id,),
+                )
+                self._conn.execute(
+                    "INSERT INTO user_stats (user_id, sessions, chars, streak, streak_end) "
+                    "SELECT user_id, COUNT(*), SUM(char_count), 0, NULL FROM sessions WHERE user_id = ?",
+                    (user_id,),
+                )
+                self._recompute_streak(user_id)
+            self._conn.commit()
+
+    def _recompute_streak(self, user_id: str) -> None:
+        # Walks back only as far as the current streak reaches
+        streak, streak_end, expected = 0, None, None
+        for (day,) in self._conn.execute(
+            "SELECT date FROM daily_stats WHERE user_id = ? ORDER BY date DESC", (user_id,)
+        ):
+            day = date.fromisoformat(day)
+            if expected is not None and day != expected:
+                break
+            streak_end = streak_end or day
+            streak += 1
+            expected = day - timedelta(days=1)
+        self._conn.execute(
+            "UPDATE user_stats SET streak = ?, streak_end = ? WHERE user_id = ?",
+            (streak, streak_end.isoformat() if streak_end else None, user_id),
+        )
+
+    def _record_added(self, user_id: str, day: date, difficulty: str, chars: int) -> None:
+        self._conn.execute(
+            "INSERT INTO daily_stats (user_id, date, sessions) VALUES (?, ?, 1) "
+            "ON CONFLICT (user_id, date) DO UPDATE SET sessions = sessions + 1",
+            (user_id, day.isoformat()),
+        )
+        self._conn.execute(
+            "INSERT INTO difficulty_stats (user_id, difficulty, sessions) VALUES (?, ?, 1) "
+            "ON CONFLICT (user_id, difficulty) DO UPDATE SET sessions = sessions + 1",
+            (user_id, difficulty or 'Unknown'),
+        )
+        row = self._conn.execute(
+            "SELECT streak, streak_end FROM user_stats WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            self._conn.execute(
+                "INSERT INTO user_stats (user_id, sessions, chars, streak, streak_end) VALUES (?, 1, ?, 1, ?)",
+                (user_id, chars, day.isoformat()),
+            )
+            return
+
+        self._conn.execute(
+            "UPDATE user_stats SET sessions = sessions + 1, chars = chars + ? WHERE user_id = ?",
+            (chars, user_id),
+        )
+        streak, streak_end = row['streak'], row['streak_end'] and date.fromisoformat(row['streak_end'])
+        if streak_end is None or day > streak_end + timedelta(days=1):
+            streak, streak_end = 1, day
+        elif day == streak_end + timedelta(days=1):
+            streak, streak_end = streak + 1, day
+        elif day < streak_end:
+            # Back-dated session: rare, so just rebuild
+            self._recompute_streak(user_id)
+            return
+        self._conn.execute(
+            "UPDATE user_stats SET streak = ?, streak_end = ? WHERE user_id = ?",
+            (streak, streak_end.isoformat(), user_id),
+        )
+
+    def _record_removed(self, user_id: str, day: date, difficulty: str, chars: int) -> None:
+        self._conn.execute(
+            "UPDATE user_stats SET sessions = sessions - 1, chars = chars - ? WHERE user_id = ?",
+            (chars, user_id),
+        )
+        self._conn.execute(
+            "UPDATE difficulty_stats SET sessions = sessions - 1 WHERE user_id = ? AND difficulty = ?",
+            (user_id, difficulty or 'Unknown'),
+        )
+        self._conn.execute(
+            "DELETE FROM difficulty_stats WHERE user_id = ? AND difficulty = ? AND sessions <= 0",
+            (user_id, difficulty or 'Unknown'),
+        )
+        self._conn.execute(
+            "UPDATE daily_stats SET sessions = sessions - 1 WHERE user_id = ? AND date = ?",
+            (user_id, day.isoformat()),
+        )
+        emptied = self._conn.execute(
+            "DELETE FROM daily_stats WHERE user_id = ? AND date = ? AND sessions <= 0",
+            (user_id, day.isoformat()),
+        ).rowcount
+        if emptied:
+            self._recompute_streak(user_id)
+
+    @classmethod
+    def from_env(cls) -> "HistoryStore":
+        return cls(os.getenv("STUDY_BUDDY_DB_PATH", DEFAULT_DB_PATH))
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add(self, user_id: str, session: dict) -> int:
+        quiz = session.get('quiz')
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO sessions (user_id, created_at, date, timestamp, level, difficulty, mode, "
+                "char_count, text, explanation, quiz) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_id,
+                    time.time(),
+                    session['date'].isoformat(),
+                    session['timestamp'],
+                    session.get('level'),
+                    session.get('difficulty'),
+                    session.get('mode'),
+                    len(session['text']),
+                    session['text'],
+                    session.get('explanation'),
+                    quiz.to_json() if quiz else None,
+                ),
+            )
+            self._record_added(user_id, session['date'], session.get('difficulty'), len(session['text']))
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def get(self, user_id: str, session_id: int):
+        """Full session, including text and parsed quiz, or None."""
+        rows = self._query("SELECT * FROM sessions WHERE user_id = ? AND id = ?", (user_id, session_id))
+        return _row_to_session(rows[0]) if rows else None
+
+    def page(self, user_id: str, limit: int, offset: int = 0) -> list:
+        """Newest-first session summaries (text preview, no quiz)."""
+        rows = self._query(
+            f"SELECT {_SUMMARY_COLUMNS} FROM sessions WHERE user_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (user_id, limit, offset),
+        )
+        return [_row_to_session(row) for row in rows]
+
+    def delete(self, user_id: str, session_id: int) -> None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT date, difficulty, char_count FROM sessions WHERE user_id = ? AND id = ?",
+                (user_id, session_id),
+            ).fetchone()
+            if row is None:
+                return
+            self._conn.execute("DELETE FROM sessions WHERE user_id = ? AND id = ?", (user_id, session_id))
+            self._record_removed(user_id, date.fromisoformat(row['date']), row['difficulty'], row['char_count'])
+            self._conn.commit()
+
+    def clear(self, user_id: str) -> None:
+        with self._lock:
+            for table in ("sessions", "user_stats", "daily_stats", "difficulty_stats"):
+                self._conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    def stats(self, user_id: str) -> HistoryStats:
+        """Session count, characters processed and current streak, read in O(1)."""
+        rows = self._query(
+            "SELECT sessions, chars, streak, streak_end FROM user_stats WHERE user_id = ?", (user_id,)
+        )
+        if not rows:
+            return HistoryStats()
+        row = rows[0]
+        streak_end = date.fromisoformat(row['streak_end']) if row['streak_end'] else None
+        return HistoryStats(row['sessions'], row['chars'], row['streak'], streak_end)
+
+    def sessions_on(self, user_id: str, day: date) -> int:
+        rows = self._query(
+            "SELECT sessions FROM daily_stats WHERE user_id = ? AND date = ?", (user_id, day.isoformat())
+        )
+        return rows[0][0] if rows else 0
+
+    def daily_counts(self, user_id: str) -> dict:
+        """Sessions per day, oldest first."""
+        rows = self._query(
+            "SELECT date, sessions FROM daily_stats WHERE user_id = ? ORDER BY date", (user_id,)
+        )
+        return {date.fromisoformat(day): count for day, count in rows}
+
+    def difficulty_counts(self, user_id: str) -> dict:
+        rows = self._query(
+            "SELECT difficulty, sessions FROM difficulty_stats WHERE user_id = ?", (user_id,)
+        )
+        return dict(rows)
@@ -1,36 +1,266 @@
-import os
-from dotenv import load_dotenv
-from groq import Groq
+import asyncio
+import json
+import logging
+import sqlite3
+from typing import Iterator
+import groq
+from llm_cache import FlightCancelled, ResponseCache, SingleFlight, make_cache_key
+from model_router import router
+from offline import OFFLINE_MODE, offline_explanation, offline_quiz, summarize
+from quiz_model import QUIZ_JSON_SCHEMA, Quiz, parse_quiz
+from scheduler import PRIORITIES, current_priority
+from text_processing import clean_text, estimate_tokens, split_into_chunks
+# LLMError and run_async are re-exported for callers of the agent API
+from llm_client import (
+    HEDGE_ENABLED, LLMError, LLMRateLimitError, LLMTimeoutError, LLMUnavailableError, async_chat_completion,
+    chat_completion, classify_error, hedged_chat_completion, run_async
+)
 
-# Load API key from .env (if present)
-load_dotenv()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Texts above this size are explained map-reduce style, chunk by chunk
+LONG_DOCUMENT_TOKENS = 3000
+CHUNK_TOKENS = 1500
+MAX_CONCURRENT_CHUNKS = 4
 
-MODEL_NAME = "llama-3.3-70b-versatile"
+# Provider failures where a local extractive summary beats an error message
+OFFLINE_FALLBACK_ERRORS = (LLMUnavailableError, LLMRateLimitError, LLMTimeoutError)
 
+# Completion budgets (max_tokens) per call; explanations scale with the requested depth
+EXPLANATION_BUDGETS = {"Beginner": 400, "Intermediate": 500, "Advanced": 650, "Expert": 800}
+DEFAULT_EXPLANATION_BUDGET = 600
+SECTION_BUDGET = 350
+QUIZ_BASE_BUDGET = 60
+QUIZ_PER_QUESTION_BUDGET = 120  # one question with four options as JSON, with headroom
+# Extra calls asking only for the questions a short quiz is missing
+QUIZ_TOP_UP_ATTEMPTS = 1
 
-def call_llm(system_prompt: str, user_prompt: str) -> str:
+# Shared by every Streamlit session in this process and persisted on disk
+response_cache = ResponseCache.from_env()
+# Identical requests running at the same time share one upstream call
+in_flight = SingleFlight()
+
+logger = logging.getLogger(__name__)
+
+
+def _messages(system_prompt: str, user_prompt: str) -> list:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _format_kwargs(json_mode: bool, max_tokens: int = None) -> dict:
+    kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+    if max_tokens:
+        kwargs["max_tokens"] = max_tokens
+    return kwargs
+
+
+def plan_max_tokens(agent: str, level: str = None, num_questions: int = 0) -> int:
+    """Completion budget for one `agent` call: "explainer", "section", "quiz" or "fused"."""
+    explanation = EXPLANATION_BUDGETS.get(level, DEFAULT_EXPLANATION_BUDGET)
+    quiz = QUIZ_BASE_BUDGET + QUIZ_PER_QUESTION_BUDGET * num_questions
+    return {"explainer": explanation, "section": SECTION_BUDGET, "quiz": quiz, "fused": explanation + quiz}[agent]
+
+
+def _complete(models: tuple, messages: list, temperature: float, timeout: float = None,
+              hedge: bool = False, **kwargs) -> tuple:
+    """Send to the first of `models` that is not rate limited, reporting each outcome to the router.
+
+    Returns ``(response, model that answered)``.
+    """
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        # Upstream time only: waiting in our own queues says nothing about the model
+        timing = {}
+        try:
+            if hedge:
+                resp = run_async(hedged_chat_completion(
+                    model, messages, temperature, timeout, retry_rate_limited=last, timing=timing, **kwargs
+                ))
+            else:
+                resp = chat_completion(model, messages, temperature, timeout, retry_rate_limited=last,
+                                       timing=timing, **kwargs)
+        except LLMError as exc:
+            router.record(model, error=exc)
+            if last or not isinstance(exc, LLMRateLimitError):
+                raise
+            continue
+        # Opening a stream says nothing about how long the completion takes
+        router.record(model, None if kwargs.get("stream") else timing.get("upstream"))
+        return resp, model
+
+
+async def _async_complete(models: tuple, messages: list, temperature: float, timeout: float = None,
+                          hedge: bool = False, **kwargs) -> tuple:
+    completion = hedged_chat_completion if hedge else async_chat_completion
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        timing = {}
+        try:
+            resp = await completion(model, messages, temperature, timeout, retry_rate_limited=last, timing=timing,
+                                    **kwargs)
+        except LLMError as exc:
+            router.record(model, error=exc)
+            if last or not isinstance(exc, LLMRateLimitError):
+                raise
+            continue
+        router.record(model, timing.get("upstream"))
+        return resp, model
+
+
+def _route(models: tuple, user_prompt: str) -> tuple:
+    # Callers that know the level or difficulty route themselves; otherwise go by size
+    return models or router.route(estimate_tokens(user_prompt))
+
+
+def _cache_model(models: tuple) -> str:
+    # The model the work's class calls for, not whichever comes first in the health-ordered route
+    return getattr(models, "preferred", models[0])
+
+
+def _flight_rank() -> int:
+    return PRIORITIES.index(current_priority.get())
+
+
+def _abandon(flight, exc: BaseException) -> None:
+    # Followers must not inherit the leader's own cancellation; they retry instead
+    if isinstance(exc, Exception):
+        flight.fail(exc)
+    else:
+        flight.cancel()
+
+
+def _land(flight, cache_key: str, content: str, cache: bool = True) -> None:
+    """Hand `content` to the flight's followers, then cache it if `cache`.
+
+    Answers from a failover model are shared with the followers but not cached: the
+    key is for the model the work was routed to.
+    """
+    # Followers go first: a failed cache write costs a later hit, not a stranded flight
+    flight.finish(content)
+    if cache:
+        try:
+            response_cache.set(cache_key, content)
+        except sqlite3.Error as exc:
+            logger.warning("Could not cache an LLM response: %s", exc)
+
+
+def call_llm(system_prompt: str, user_prompt: str, temperature: float = 0.3, timeout: float = None,
+             json_mode: bool = False, hedge: bool = HEDGE_ENABLED, models: tuple = None,
+             max_tokens: int = None) -> str:
+    """Return the completion text; raises an `LLMError` subclass when the provider fails.
+
+    `models` are tried in order, moving on when one is rate limited (default: the
+    router's choice); `max_tokens` caps the answer (see `plan_max_tokens`). With `hedge`, a slow request is duplicated and the faster
+    answer wins (see `hedged_chat_completion`).
+    """
+    models = _route(models, user_prompt)
+    cache_key = make_cache_key(_cache_model(models), system_prompt, user_prompt, temperature)
+    while True:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        flight, leader = in_flight.join(cache_key, _flight_rank())
+        if leader:
+            break
+        try:
+            return flight.wait()
+        except FlightCancelled:
+            continue  # the leader went away; try again, perhaps as the new leader
     try:
-        resp = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.3,
+        resp, answered = _complete(
+            models, _messages(system_prompt, user_prompt), temperature, timeout=timeout, hedge=hedge,
+            **_format_kwargs(json_mode, max_tokens)
         )
-        return resp.choices[0].message.content.strip()
-    except Exception:
-        # Fallback for offline or API failures — return a helpful placeholder
-        placeholder = (
-            "[LLM unavailable — running in offline mode].\n\n"
-            "Summary: Unable to contact LLM. Please check GROQ_API_KEY and network.\n"
-            "Key Points:\n1) Unable to generate explanation due to connection error.\n"
+        content = resp.choices[0].message.content.strip()
+    except BaseException as exc:
+        _abandon(flight, exc)
+        raise
+    _land(flight, cache_key, content, cache=answered == _cache_model(models))
+    return content
+
+
+def call_llm_stream(system_prompt: str, user_prompt: str, temperature: float = 0.3,
+                    timeout: float = None, json_mode: bool = False, models: tuple = None,
+                    max_tokens: int = None) -> Iterator[str]:
+    """Like `call_llm`, but yields the completion piece by piece as it arrives."""
+    models = _route(models, user_prompt)
+    cache_key = make_cache_key(_cache_model(models), system_prompt, user_prompt, temperature)
+    while True:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        flight, leader = in_flight.join(cache_key, _flight_rank())
+        if leader:
+            break
+        followed = False
+        try:
+            # Replays what the leader has streamed so far, then follows it live
+            for part in flight.follow():
+                followed = True
+                yield part
+            return
+        except FlightCancelled:
+            if followed:
+                # A fresh answer cannot be spliced onto the start of the abandoned one
+                raise LLMUnavailableError("The shared request was cancelled partway through") from None
+    parts = []
+    try:
+        stream, answered = _complete(
+            models, _messages(system_prompt, user_prompt), temperature, timeout=timeout, stream=True,
+            **_format_kwargs(json_mode, max_tokens)
         )
-        return placeholder
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                flight.push(delta)
+                yield delta
+    except groq.APIError as exc:
+        # A stream cut off halfway is never cached
+        error = classify_error(exc)
+        flight.fail(error)
+        raise error from exc
+    except BaseException as exc:
+        _abandon(flight, exc)
+        raise
 
+    content = "".join(parts).strip()
+    _land(flight, cache_key, content, cache=bool(content) and answered == _cache_model(models))
 
-def explainer_agent(text: str, level: str = "Detailed") -> dict:
+
+async def async_call_llm(system_prompt: str, user_prompt: str, temperature: float = 0.3,
+                         timeout: float = None, json_mode: bool = False, hedge: bool = HEDGE_ENABLED,
+                         models: tuple = None, max_tokens: int = None) -> str:
+    models = _route(models, user_prompt)
+    cache_key = make_cache_key(_cache_model(models), system_prompt, user_prompt, temperature)
+    while True:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        flight, leader = in_flight.join(cache_key, _flight_rank())
+        if leader:
+            break
+        try:
+            # Shielded so one follower giving up does not cancel the flight for the rest
+            return await asyncio.shield(asyncio.wrap_future(flight.future))
+        except FlightCancelled:
+            continue
+    try:
+        resp, answered = await _async_complete(
+            models, _messages(system_prompt, user_prompt), temperature, timeout=timeout, hedge=hedge,
+            **_format_kwargs(json_mode, max_tokens)
+        )
+        content = resp.choices[0].message.content.strip()
+    except BaseException as exc:
+        _abandon(flight, exc)
+        raise
+    _land(flight, cache_key, content, cache=answered == _cache_model(models))
+    return content
+
+
+def _explainer_prompts(text: str, level: str) -> tuple:
     system_prompt = (
         "You are an explainer agent. "
         "Explain concepts in simple English for a beginner student. "
@@ -45,32 +275,547 @@ Read the following study text and produce a concise explanation at the requested
 Text:
 {text}
 """
+    return system_prompt, user_prompt
 
-    raw = call_llm(system_prompt, user_prompt)
-    return {"explanation_text": raw}
 
+def _chunk_explainer_prompts(chunk: str, index: int, total: int, level: str) -> tuple:
+    system_prompt = (
+        "You are an explainer agent working on one section of a longer document. "
+        "Explain concepts in simple English for a beginner student."
+    )
+
+    user_prompt = f"""
+This is section {index} of {total} of a longer study text. Explain it at the requested level ({level}).
+1) A short explanation of this section (2-4 sentences).
+2) The 2-4 most important points in this section (numbered list).
 
-def quiz_agent(explanation: str, difficulty: str = "Medium", num_questions: int = 5) -> str:
+Section:
+{chunk}
+"""
+    return system_prompt, user_prompt
+
+
+def _reduce_explainer_prompts(partials: list, level: str) -> tuple:
+    system_prompt = (
+        "You are an explainer agent. "
+        "Explain concepts in simple English for a beginner student. "
+        "Output JSON-like text containing a short explanation and key points."
+    )
+
+    sections = "\n\n".join(f"Section {i}:\n{partial}" for i, partial in enumerate(partials, 1))
+    user_prompt = f"""
+Below are explanations of consecutive sections of one study text. Combine them into a single
+concise explanation of the whole text at the requested level ({level}).
+1) A short explanation (3-5 sentences).
+2) 3-5 key points (numbered list), merging duplicates across sections.
+
+Section explanations:
+{sections}
+"""
+    return system_prompt, user_prompt
+
+
+def is_long_document(text: str) -> bool:
+    return estimate_tokens(text) > LONG_DOCUMENT_TOKENS
+
+
+async def _map_reduce_partials(text: str, level: str, max_concurrency: int = MAX_CONCURRENT_CHUNKS) -> list:
+    """Explain every chunk in parallel, then fold the partials until one reduce call fits."""
+    chunks = split_into_chunks(text, CHUNK_TOKENS)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def bounded(system_prompt, user_prompt, max_tokens):
+        async with semaphore:
+            return await async_call_llm(system_prompt, user_prompt, max_tokens=max_tokens)
+
+    partials = await asyncio.gather(*(
+        bounded(*_chunk_explainer_prompts(chunk, i, len(chunks), level), plan_max_tokens("section"))
+        for i, chunk in enumerate(chunks, 1)
+    ))
+
+    # Very long inputs produce more partials than one prompt can hold: reduce in groups
+    while estimate_tokens("\n\n".join(partials)) > LONG_DOCUMENT_TOKENS and len(partials) > 1:
+        groups, group, group_tokens = [], [], 0
+        for partial in partials:
+            tokens = estimate_tokens(partial)
+            if group and group_tokens + tokens > CHUNK_TOKENS:
+                groups.append(group)
+                group, group_tokens = [], 0
+            group.append(partial)
+            group_tokens += tokens
+        groups.append(group)
+        if len(groups) == len(partials):
+            break
+        partials = await asyncio.gather(*(
+            bounded(*_reduce_explainer_prompts(group, level), plan_max_tokens("section")) for group in groups
+        ))
+    return list(partials)
+
+
+async def async_long_explainer_agent(text: str, level: str = "Detailed",
+                                     max_concurrency: int = MAX_CONCURRENT_CHUNKS) -> dict:
+    partials = await _map_reduce_partials(text, level, max_concurrency)
+    raw = await async_call_llm(*_reduce_explainer_prompts(partials, level), max_tokens=plan_max_tokens("explainer", level))
+    return {"explanation_text": raw, "chunks": len(split_into_chunks(text, CHUNK_TOKENS))}
+
+
+_QUIZ_SOURCES = {
+    "explanation": ("the explanation and key points", "Explanation and key points"),
+    "text": ("the study text", "Study text"),
+}
+
+
+_QUIZ_FORMAT = (
+    "Respond only with a JSON object matching this JSON schema, with exactly 4 options per question "
+    "and the correct option's letter as the answer:\n" + json.dumps(QUIZ_JSON_SCHEMA)
+)
+
+
+def _quiz_prompts(explanation: str, difficulty: str, num_questions: int, source: str = "explanation") -> tuple:
+    system_prompt = (
+        "You are a quiz generator agent. "
+        "Create straightforward multiple-choice questions appropriate for the requested difficulty. "
+        + _QUIZ_FORMAT
+    )
+
+    description, heading = _QUIZ_SOURCES[source]
+    user_prompt = f"""
+Using {description} below, create {num_questions} multiple-choice quiz questions at '{difficulty}' difficulty.
+Each question has 4 options (A, B, C, D) and one correct answer letter.
+
+{heading}:
+{explanation}
+"""
+    return system_prompt, user_prompt
+
+
+def _extend_quiz_prompts(quiz: Quiz, explanation: str, difficulty: str, extra: int,
+                         source: str = "explanation") -> tuple:
     system_prompt = (
         "You are a quiz generator agent. "
-        "Create straightforward multiple-choice questions appropriate for the requested difficulty."
+        "Add new multiple-choice questions to an existing quiz without repeating or rephrasing its questions. "
+        + _QUIZ_FORMAT
+    )
+
+    description, heading = _QUIZ_SOURCES[source]
+    # Question stems are enough to avoid repeats; options and answers would only cost input tokens
+    existing = "\n".join(f"- {question.question}" for question in quiz)
+    user_prompt = f"""
+Using {description} below, create {extra} more multiple-choice quiz questions at '{difficulty}' difficulty.
+Each question has 4 options (A, B, C, D) and one correct answer letter.
+Cover different points than these questions, which the quiz already has:
+{existing}
+
+{heading}:
+{explanation}
+"""
+    return system_prompt, user_prompt
+
+
+def _quiz_request_prompts(explanation: str, difficulty: str, missing: int, quiz: Quiz, source: str) -> tuple:
+    if len(quiz):
+        return _extend_quiz_prompts(quiz, explanation, difficulty, missing, source)
+    return _quiz_prompts(explanation, difficulty, missing, source)
+
+
+def _refine_quiz_prompts(quiz: Quiz, explanation: str, difficulty: str, num_questions: int) -> tuple:
+    system_prompt = (
+        "You are a quiz reviewer agent. "
+        "Check multiple-choice questions against an explanation and fix any that are wrong or off-topic. "
+        + _QUIZ_FORMAT
     )
 
     user_prompt = f"""
-Using the explanation and key points below, create {num_questions} quiz questions at '{difficulty}' difficulty.
-For each question, provide:
-- Question
-- 4 options (A, B, C, D)
-- Correct answer letter
+Review the {num_questions} '{difficulty}' quiz questions below against the explanation.
+Fix incorrect answers, replace questions the explanation does not support, and return the final quiz.
 
 Explanation and key points:
 {explanation}
+
+Quiz:
+{quiz.to_json()}
 """
+    return system_prompt, user_prompt
+
+
+_FUSED_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "explanation": {"type": "string"},
+        "key_points": {"type": "array", "items": {"type": "string"}},
+        "questions": QUIZ_JSON_SCHEMA["properties"]["questions"],
+    },
+    "required": ["explanation", "key_points", "questions"],
+}
+
+
+def _fused_prompts(text: str, level: str, difficulty: str, num_questions: int) -> tuple:
+    system_prompt = (
+        "You are a study agent that both explains and quizzes. "
+        "Explain concepts in simple English for a beginner student, then write multiple-choice questions "
+        "on what you explained. Respond only with a JSON object matching this JSON schema, with exactly "
+        "4 options per question and the correct option's letter as the answer:\n" + json.dumps(_FUSED_JSON_SCHEMA)
+    )
+
+    user_prompt = f"""
+Read the following study text and produce, in one response:
+1) "explanation": a short explanation (3-5 sentences) at the requested level ({level}).
+2) "key_points": 3-5 key points.
+3) "questions": {num_questions} multiple-choice quiz questions at '{difficulty}' difficulty, each with 4 options (A, B, C, D) and one correct answer letter.
+
+Text:
+{text}
+"""
+    return system_prompt, user_prompt
+
+
+def _parse_fused(raw: str, difficulty: str) -> dict:
+    """Split a fused response into explanation text (with numbered key points) and a `Quiz`."""
+    try:
+        data = json.loads(raw.strip().removeprefix("```json").removeprefix("```").removesuffix("```"))
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        # Not the requested JSON: keep the text as the explanation and salvage any questions
+        return {"explanation_text": raw, "key_points": [], "quiz": parse_quiz(raw, difficulty)}
+
+    key_points = [str(point).strip() for point in data.get("key_points") or [] if str(point).strip()]
+    explanation = str(data.get("explanation") or "").strip()
+    if key_points:
+        # Same shape as the explainer agent's output, so history and the Key Points tab read it alike
+        explanation += "\n\nKey points:\n" + "\n".join(f"{i}. {point}" for i, point in enumerate(key_points, 1))
+    return {"explanation_text": explanation, "key_points": key_points, "quiz": parse_quiz(data, difficulty)}
+
+
+def _explainer_models(text: str, level: str) -> tuple:
+    return router.route(estimate_tokens(text), level=level)
+
+
+def _quiz_models(source: str, difficulty: str, num_questions: int) -> tuple:
+    return router.route(estimate_tokens(source), difficulty=difficulty, num_questions=num_questions)
+
+
+def _offline_result(text: str, level: str) -> dict:
+    return {"explanation_text": offline_explanation(text, level), "offline": True}
 
-    quiz_text = call_llm(system_prompt, user_prompt)
-    return quiz_text
+
+def _offline_study(text: str, level: str, difficulty: str, num_questions: int) -> dict:
+    return {
+        "explanation_text": offline_explanation(text, level),
+        "key_points": summarize(text, level)["key_points"],
+        "quiz": offline_quiz(text, difficulty, num_questions),
+        "offline": True,
+    }
+
+
+def _stream_with_fallback(stream: Iterator[str], fallback) -> Iterator[str]:
+    """Yield from `stream`, or `fallback()` instead if the provider fails before the first token."""
+    if OFFLINE_MODE:
+        yield fallback()
+        return
+    started = False
+    try:
+        for piece in stream:
+            started = True
+            yield piece
+    except OFFLINE_FALLBACK_ERRORS:
+        # Half an LLM answer followed by a local one would read as one garbled answer
+        if started:
+            raise
+        yield fallback()
+
+
+def explainer_agent(text: str, level: str = "Detailed") -> dict:
+    """Explanation of `text`; falls back to an offline summary when the provider is down or overloaded."""
+    text = clean_text(text).text
+    if OFFLINE_MODE:
+        return _offline_result(text, level)
+    try:
+        if is_long_document(text):
+            return run_async(async_long_explainer_agent(text, level=level))
+        raw = call_llm(
+            *_explainer_prompts(text, level), models=_explainer_models(text, level),
+            max_tokens=plan_max_tokens("explainer", level)
+        )
+    except OFFLINE_FALLBACK_ERRORS:
+        return _offline_result(text, level)
+    return {"explanation_text": raw}
+
+
+def _explainer_stream(text: str, level: str) -> Iterator[str]:
+    if is_long_document(text):
+        # Sections are explained in parallel up front; only the final merge is streamed
+        partials = run_async(_map_reduce_partials(text, level))
+        yield from call_llm_stream(
+            *_reduce_explainer_prompts(partials, level), max_tokens=plan_max_tokens("explainer", level)
+        )
+        return
+    yield from call_llm_stream(
+        *_explainer_prompts(text, level), models=_explainer_models(text, level),
+        max_tokens=plan_max_tokens("explainer", level)
+    )
+
+
+def explainer_agent_stream(text: str, level: str = "Detailed") -> Iterator[str]:
+    text = clean_text(text).text
+    return _stream_with_fallback(_explainer_stream(text, level), lambda: offline_explanation(text, level))
+
+
+def quiz_agent(explanation: str, difficulty: str = "Medium", num_questions: int = 5,
+               existing: Quiz = None) -> Quiz:
+    """Quiz on `explanation`, generating only the questions `existing` lacks and appending them.
+
+    A quiz that comes back short is topped up the same way. Falls back to local
+    cloze questions when the provider is down or overloaded.
+    """
+    quiz = Quiz(difficulty=difficulty).extended(existing or Quiz(), num_questions)
+    for _ in range(1 + QUIZ_TOP_UP_ATTEMPTS):
+        missing = num_questions - len(quiz)
+        if missing <= 0:
+            break
+        if OFFLINE_MODE:
+            new = offline_quiz(explanation, difficulty, num_questions)
+        else:
+            try:
+                raw = call_llm(
+                    *_quiz_request_prompts(explanation, difficulty, missing, quiz, "explanation"), json_mode=True,
+                    models=_quiz_models(explanation, difficulty, missing),
+                    max_tokens=plan_max_tokens("quiz", num_questions=missing)
+                )
+                new = parse_quiz(raw, difficulty)
+            except OFFLINE_FALLBACK_ERRORS:
+                new = offline_quiz(explanation, difficulty, num_questions)
+        before, quiz = len(quiz), quiz.extended(new, num_questions)
+        if len(quiz) == before:
+            break  # nothing new came back; asking again would not help
+    return quiz
+
+
+def quiz_agent_stream(explanation: str, difficulty: str = "Medium", num_questions: int = 5) -> Iterator[str]:
+    """Yield the raw JSON as it arrives; feed the joined text to `parse_quiz`."""
+    stream = call_llm_stream(
+        *_quiz_prompts(explanation, difficulty, num_questions), json_mode=True,
+        models=_quiz_models(explanation, difficulty, num_questions),
+        max_tokens=plan_max_tokens("quiz", num_questions=num_questions)
+    )
+    return _stream_with_fallback(stream, lambda: offline_quiz(explanation, difficulty, num_questions).to_json())
+
+
+async def async_explainer_agent(text: str, level: str = "Detailed") -> dict:
+    text = clean_text(text).text
+    if OFFLINE_MODE:
+        return _offline_result(text, level)
+    try:
+        if is_long_document(text):
+            return await async_long_explainer_agent(text, level=level)
+        raw = await async_call_llm(
+            *_explainer_prompts(text, level), models=_explainer_models(text, level),
+            max_tokens=plan_max_tokens("explainer", level)
+        )
+    except OFFLINE_FALLBACK_ERRORS:
+        return _offline_result(text, level)
+    return {"explanation_text": raw}
+
+
+async def async_quiz_agent(explanation: str, difficulty: str = "Medium", num_questions: int = 5,
+                           source: str = "explanation", existing: Quiz = None) -> Quiz:
+    quiz = Quiz(difficulty=difficulty).extended(existing or Quiz(), num_questions)
+    for _ in range(1 + QUIZ_TOP_UP_ATTEMPTS):
+        missing = num_questions - len(quiz)
+        if missing <= 0:
+            break
+        if OFFLINE_MODE:
+            new = offline_quiz(explanation, difficulty, num_questions)
+        else:
+            try:
+                raw = await async_call_llm(
+                    *_quiz_request_prompts(explanation, difficulty, missing, quiz, source), json_mode=True,
+                    models=_quiz_models(explanation, difficulty, missing),
+                    max_tokens=plan_max_tokens("quiz", num_questions=missing)
+                )
+                new = parse_quiz(raw, difficulty)
+            except OFFLINE_FALLBACK_ERRORS:
+                new = offline_quiz(explanation, difficulty, num_questions)
+        before, quiz = len(quiz), quiz.extended(new, num_questions)
+        if len(quiz) == before:
+            break
+    return quiz
+
+
+def fused_study_agent(text: str, level: str = "Detailed", difficulty: str = "Medium",
+                      num_questions: int = 5) -> dict:
+    """Explanation, key points and quiz from one LLM call instead of two.
+
+    Long documents do not fit one prompt and go through `study_pipeline` instead.
+    """
+    text = clean_text(text).text
+    if is_long_document(text):
+        return run_async(study_pipeline(text, level=level, difficulty=difficulty, num_questions=num_questions))
+    if OFFLINE_MODE:
+        return _offline_study(text, level, difficulty, num_questions)
+    try:
+        raw = call_llm(
+            *_fused_prompts(text, level, difficulty, num_questions), json_mode=True,
+            models=router.route(estimate_tokens(text), level=level, difficulty=difficulty, num_questions=num_questions),
+            max_tokens=plan_max_tokens("fused", level, num_questions)
+        )
+    except OFFLINE_FALLBACK_ERRORS:
+        return _offline_study(text, level, difficulty, num_questions)
+    result = _parse_fused(raw, difficulty)
+    if len(result["quiz"]) < num_questions:
+        result["quiz"] = quiz_agent(result["explanation_text"], difficulty, num_questions, existing=result["quiz"])
+    return result
+
+
+async def async_fused_study_agent(text: str, level: str = "Detailed", difficulty: str = "Medium",
+                                  num_questions: int = 5) -> dict:
+    text = clean_text(text).text
+    if is_long_document(text):
+        return await study_pipeline(text, level=level, difficulty=difficulty, num_questions=num_questions)
+    if OFFLINE_MODE:
+        return _offline_study(text, level, difficulty, num_questions)
+    try:
+        raw = await async_call_llm(
+            *_fused_prompts(text, level, difficulty, num_questions), json_mode=True,
+            models=router.route(estimate_tokens(text), level=level, difficulty=difficulty, num_questions=num_questions),
+            max_tokens=plan_max_tokens("fused", level, num_questions)
+        )
+    except OFFLINE_FALLBACK_ERRORS:
+        return _offline_study(text, level, difficulty, num_questions)
+    result = _parse_fused(raw, difficulty)
+    if len(result["quiz"]) < num_questions:
+        result["quiz"] = await async_quiz_agent(
+            result["explanation_text"], difficulty, num_questions, existing=result["quiz"]
+        )
+    return result
+
+
+async def study_pipeline(text: str, level: str = "Detailed", difficulty: str = "Medium",
+                         num_questions: int = 5, refine: bool = False) -> dict:
+    """Explain `text` and quiz it concurrently; optionally refine the quiz against the explanation."""
+    text = clean_text(text).text
+    if is_long_document(text):
+        # The whole text would not fit in the quiz prompt; quiz the merged explanation instead
+        explanation = (await async_explainer_agent(text, level=level))["explanation_text"]
+        quiz = await async_quiz_agent(explanation, difficulty=difficulty, num_questions=num_questions)
+        return {"explanation_text": explanation, "quiz": quiz}
+
+    explanation_obj, quiz = await asyncio.gather(
+        async_explainer_agent(text, level=level),
+        async_quiz_agent(text, difficulty=difficulty, num_questions=num_questions, source="text"),
+    )
+    explanation = explanation_obj["explanation_text"]
+
+    if refine and not OFFLINE_MODE:
+        try:
+            raw = await async_call_llm(
+                *_refine_quiz_prompts(quiz, explanation, difficulty, num_questions), json_mode=True,
+                models=_quiz_models(explanation, difficulty, num_questions),
+                max_tokens=plan_max_tokens("quiz", num_questions=num_questions)
+            )
+            refined = parse_quiz(raw, difficulty)
+        except OFFLINE_FALLBACK_ERRORS:
+            refined = None  # the unrefined quiz is still a good quiz
+        # A review that came back malformed or short must not replace a complete quiz
+        if refined is not None and len(refined) >= min(num_questions, len(quiz)):
+            quiz = refined
+
+    return {"explanation_text": explanation, "quiz": quiz}
+
+
+def _prompt_tokens(prompts: tuple) -> int:
+    return sum(estimate_tokens(prompt) for prompt in prompts)
+
+
+def plan_calls(text: str, level: str = "Detailed", difficulty: str = "Medium", num_questions: int = 5,
+               fused: bool = False, parallel: bool = True, refine: bool = False) -> list:
+    """Estimate, before anything is sent, each call a full session will make.
+
+    Returns ``(label, prompt_tokens, max_tokens)`` tuples. Explanations not yet
+    written are counted at their full budget.
+    """
+    text = clean_text(text).text
+    explanation_budget = plan_max_tokens("explainer", level)
+    quiz_budget = plan_max_tokens("quiz", num_questions=num_questions)
+    # A quiz written from the explanation sees the explanation in its prompt
+    quiz_on_explanation = ("Quiz", _prompt_tokens(_quiz_prompts("", difficulty, num_questions)) + explanation_budget,
+                           quiz_budget)
+
+    if is_long_document(text):
+        chunks = split_into_chunks(text, CHUNK_TOKENS)
+        calls = [
+            (f"Section {i} explainer", _prompt_tokens(_chunk_explainer_prompts(chunk, i, len(chunks), level)),
+             SECTION_BUDGET)
+            for i, chunk in enumerate(chunks, 1)
+        ]
+        calls.append(("Merge explainer", _prompt_tokens(_reduce_explainer_prompts([], level))
+                      + SECTION_BUDGET * len(chunks), explanation_budget))
+        calls.append(quiz_on_explanation)
+        return calls
+
+    if fused:
+        return [("Explainer + quiz", _prompt_tokens(_fused_prompts(text, level, difficulty, num_questions)),
+                 plan_max_tokens("fused", level, num_questions))]
+
+    calls = [("Explainer", _prompt_tokens(_explainer_prompts(text, level)), explanation_budget)]
+    if not parallel:
+        calls.append(quiz_on_explanation)
+        return calls
+    calls.append(("Quiz", _prompt_tokens(_quiz_prompts(text, difficulty, num_questions, "text")), quiz_budget))
+    if refine:
+        calls.append(("Quiz review", _prompt_tokens(_refine_quiz_prompts(Quiz(), "", difficulty, num_questions))
+                      + explanation_budget + quiz_budget, quiz_budget))
+    return calls
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="study_buddy.py",
+        description="Explainer and quiz agents for AI Study Buddy.",
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    batch_parser = commands.add_parser(
+        "batch", help="Pre-generate explanations and quizzes for a directory of .txt/.md files or a JSONL file"
+    )
+    batch_parser.add_argument("source", help="directory of text files, or JSONL with 'id' and 'text' per line")
+    batch_parser.add_argument("-o", "--output", default="batch_results.jsonl",
+                              help="JSONL results file; rerunning resumes where it stopped")
+    batch_parser.add_argument("--level", default="Intermediate")
+    batch_parser.add_argument("--difficulty", default="Medium")
+    batch_parser.add_argument("--num-questions", type=int, default=5)
+    batch_parser.add_argument("--workers", type=int, default=4, help="passages processed concurrently")
+
+    bundle_parser = commands.add_parser(
+        "bundle", help="Pre-generate the Quick Start examples at every level and difficulty"
+    )
+    bundle_parser.add_argument("-o", "--output", default=None,
+                               help="bundle file (default: assets/examples_bundle.json)")
+
+    args = parser.parse_args(argv)
+    if args.command == "bundle":
+        from examples import DEFAULT_BUNDLE_PATH, build_bundle
+
+        counts = build_bundle(args.output or DEFAULT_BUNDLE_PATH)
+        print(f"Done: {counts['built']} built, {counts['failed']} failed, {counts['kept']} already complete.")
+        return 1 if counts["failed"] else 0
+    if args.command != "batch":
+        # Lightweight CLI fallback
+        print("This module provides `explainer_agent` and `quiz_agent` for the Streamlit app.")
+        parser.print_help()
+        return 0
+
+    from batch import run_batch
+
+    counts = run_batch(
+        args.source, args.output, level=args.level, difficulty=args.difficulty,
+        num_questions=args.num_questions, workers=args.workers,
+    )
+    print(f"Done: {counts['ok']} generated, {counts['failed']} failed, {counts['skipped']} already complete.")
+    return 1 if counts["failed"] else 0
 
 
 if __name__ == "__main__":
-    # Lightweight CLI fallback
-    print("This module provides `explainer_agent` and `quiz_agent` for the Streamlit app.")
+    raise SystemExit(main())
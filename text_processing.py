@@ -0,0 +1,134 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+
+# Llama-family tokenizers average roughly four characters of English per token
+CHARS_PER_TOKEN = 4
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+_PAGE_NUMBER_LINE = re.compile(
+    r"^page\s*\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?$|^\d{1,4}\s*of\s*\d{1,4}$|^-\s*\d{1,4}\s*-$", re.I
+)
+_BARE_NUMBER_LINE = re.compile(r"^\d{1,4}$")
+_HYPHENATED_BREAK = re.compile(r"(?<=[^\W\d_])-\n(?=[^\W\d_])")  # words only, never numbers
+_INLINE_SPACE = re.compile(r"[ \t\f\v\u00a0\u2000-\u200b\u3000]+")
+# Short lines seen this often are running headers/footers from a PDF copy-paste
+REPEATED_LINE_MIN_COUNT = 3
+REPEATED_LINE_CHARS = range(10, 81)  # shorter repeats are likely list items or answers
+# A line that is only a number is a page number if it counts up, one per page, this many times
+PAGE_NUMBER_MIN_RUN = 3
+PAGE_MIN_LINES = 3  # lines from one page number to the next; closer numbers are a list or table
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, dependency-free token estimate used for budgeting and chunking."""
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def _split_oversized(piece: str, max_tokens: int) -> list:
+    """Break a paragraph that exceeds the budget into sentences, then words."""
+    out = []
+    for sentence in _SENTENCE_END.split(piece):
+        if estimate_tokens(sentence) <= max_tokens:
+            out.append(sentence)
+            continue
+        words = sentence.split()
+        step = max(1, max_tokens * CHARS_PER_TOKEN // 6)  # ~6 chars per word incl. space
+        for i in range(0, len(words), step):
+            out.append(" ".join(words[i:i + step]))
+    return out
+
+
+def split_into_chunks(text: str, max_tokens: int = 1500) -> list:
+    """Pack paragraphs (or sentences, for long paragraphs) into chunks of at most `max_tokens`."""
+    pieces = []
+    for paragraph in _PARAGRAPH_BREAK.split(text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(_split_oversized(paragraph, max_tokens))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+@dataclass(slots=True)
+class CleanedText:
+    text: str
+    tokens: int
+    original_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.tokens
+
+
+def _page_number_lines(lines: list) -> set:
+    """Indices of page-number lines: "Page 3", "3 of 12", "- 3 -", or bare numbers counting up page by page."""
+    found, runs, run_expecting = set(), [], {}
+    for i, line in enumerate(lines):
+        if _PAGE_NUMBER_LINE.match(line):
+            found.add(i)
+        elif _BARE_NUMBER_LINE.match(line):
+            value = int(line)
+            run = run_expecting.get(value)
+            if run is None or i - run[-1] < PAGE_MIN_LINES:
+                run = []
+                runs.append(run)
+            run.append(i)
+            run_expecting[value + 1] = run
+    # Years, table cells and numeric answers stay unless they look like page numbers
+    found.update(i for run in runs if len(run) >= PAGE_NUMBER_MIN_RUN for i in run)
+    return found
+
+
+def clean_text(text: str) -> CleanedText:
+    """Normalise pasted study text and drop what only costs prompt tokens.
+
+    Removes page numbers, running headers/footers, duplicate paragraphs, PDF
+    line-break hyphenation and redundant whitespace. Idempotent.
+    """
+    original_tokens = estimate_tokens(text)
+    text = unicodedata.normalize("NFKC", text or "").replace("\r\n", "\n").replace("\r", "\n")
+
+    lines = [_INLINE_SPACE.sub(" ", line).strip() for line in text.split("\n")]
+    counts = Counter(line for line in lines if len(line) in REPEATED_LINE_CHARS)
+    repeated = {line for line, count in counts.items() if count >= REPEATED_LINE_MIN_COUNT}
+    page_numbers = _page_number_lines(lines)
+    lines = [
+        line for i, line in enumerate(lines)
+        if i not in page_numbers and line not in repeated
+    ]
+
+    # Joined only once lines are stripped and page numbers dropped, or a second pass would join more
+    text = _HYPHENATED_BREAK.sub("", "\n".join(lines))
+
+    paragraphs, seen = [], set()
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        key = paragraph.lower()
+        if paragraph and key not in seen:
+            seen.add(key)
+            paragraphs.append(paragraph)
+    cleaned = "\n\n".join(paragraphs)
+    return CleanedText(cleaned, estimate_tokens(cleaned), original_tokens)